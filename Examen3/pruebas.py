@@ -1,7 +1,20 @@
 import unittest
 from unittest.mock import patch
+import asyncio
+import io
+import itertools
+import json
 import math
-from tipo import TipoAtomico, TipoCompuesto, ManejadorTipos, main
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import rendimiento
+import servidor
+import tipo
+from tipo import TipoAtomico, TipoCompuesto, TablaTipos, ManejadorTipos, main, ejecutar_script
 
 
 class TestManejadorTiposAltaCobertura(unittest.TestCase):
@@ -109,6 +122,17 @@ class TestManejadorTiposAltaCobertura(unittest.TestCase):
         self.assertIsInstance(mejor_ali, int)
         self.assertIsInstance(bits, int)
 
+    def test_mejor_reordenamiento_evaluador_anterior(self):
+        self.mt.agregar_tipo_atomico("c", 1, 2)
+        self.mt.agregar_tipo_atomico("i", 4, 4)
+        self.mt.agregar_tipo_compuesto("s", ["c", "i", "c"])
+        # size_alineacion recibía el nombre del tipo: se adapta a evaluar_orden
+        self.assertEqual(self.mt.mejor_reordenamiento("s", self.mt.size_alineacion, metodo="fuerza_bruta"),
+                         self.mt.mejor_reordenamiento("s", metodo="fuerza_bruta"))
+        with self.assertRaises(TypeError):
+            self.mt.mejor_reordenamiento("s", lambda tipo_nombre, es_union, optimo: (0, 0, 0, 0, 0),
+                                         metodo="fuerza_bruta")
+
     def test_mejor_reordenamiento_no_altera_tipo_original(self):
         self.mt.agregar_tipo_atomico("x", 1, 2)
         self.mt.agregar_tipo_atomico("y", 2, 2)
@@ -120,6 +144,326 @@ class TestManejadorTiposAltaCobertura(unittest.TestCase):
         restaurado = self.mt.tipos["t"].campos
         self.assertEqual(original, restaurado)
 
+    # -----------------------------
+    # Reordenamiento dinámico: contraste con la fuerza bruta
+    # -----------------------------
+    def test_reordenamiento_dinamico_igual_a_fuerza_bruta(self):
+        self.mt.agregar_tipo_atomico("char", 1, 2)
+        self.mt.agregar_tipo_atomico("int", 4, 4)
+        self.mt.agregar_tipo_atomico("raro", 5, 3)
+        self.mt.agregar_tipo_compuesto("foo", ["char", "int", "raro", "char"])
+        self.mt.agregar_tipo_compuesto("bar", ["raro", "foo", "int"], es_union=True)
+        self.mt.agregar_tipo_compuesto("foobar", ["foo", "char", "bar", "int", "raro"])
+        for nombre in ("foo", "bar", "foobar"):
+            self.assertEqual(self.mt.mejor_reordenamiento(nombre, metodo="fuerza_bruta"),
+                             self.mt.mejor_reordenamiento(nombre, verificar=True))
+
+    def test_reordenamiento_dinamico_struct_ancho(self):
+        self.mt.agregar_tipo_atomico("char", 1, 1)
+        self.mt.agregar_tipo_atomico("int", 4, 4)
+        self.mt.agregar_tipo_atomico("double", 8, 8)
+        self.mt.agregar_tipo_compuesto("ancho", ["char", "double", "int"] * 10)
+        # 30 campos: inviable por permutaciones, inmediato por clases
+        self.assertEqual(self.mt.mejor_reordenamiento("ancho"), (130, 1, 0))
+
+    def test_reordenamiento_dinamico_campos_distintos(self):
+        # Cada campo es de un tipo distinto, así que hay muchas clases
+        for i in range(40):
+            alineacion = (1, 2, 4, 8)[i % 4]
+            self.mt.agregar_tipo_atomico(f"t{i}", alineacion * (1 + i * 7 % 11), alineacion)
+        self.mt.agregar_tipo_compuesto("ancho", [f"t{i}" for i in range(40)])
+        azar = random.Random(0)
+        for i in range(16):
+            self.mt.agregar_tipo_atomico(f"r{i}", azar.randint(1, 24), azar.choice((1, 2, 4, 8)))
+        self.mt.agregar_tipo_compuesto("irregular", [f"r{i}" for i in range(16)])
+        inicio = time.perf_counter()
+        tamano, _, desperdicio = self.mt.mejor_reordenamiento("ancho")
+        irregular = self.mt.mejor_reordenamiento("irregular")
+        self.assertLess(time.perf_counter() - inicio, 5)
+        self.assertEqual((tamano, desperdicio), (sum(self.mt.tipos[f"t{i}"].representacion for i in range(40)), 0))
+        self.assertEqual(irregular, (229, 8, 5))
+
+    def test_reordenamiento_paralelo_igual_a_secuencial(self):
+        self.mt.agregar_tipo_atomico("char", 1, 2)
+        self.mt.agregar_tipo_atomico("int", 4, 4)
+        self.mt.agregar_tipo_atomico("raro", 5, 3)
+        self.mt.agregar_tipo_compuesto("foo", ["raro", "char", "int", "char"])
+        self.mt.agregar_tipo_compuesto("bar", ["raro", "foo", "int"], es_union=True)
+        self.mt.agregar_tipo_compuesto("foobar", ["foo", "char", "bar", "int", "raro", "char"])
+        for nombre in ("foo", "bar", "foobar"):
+            self.assertEqual(self.mt.mejor_reordenamiento(nombre, metodo="paralelo", trabajadores=2),
+                             self.mt.mejor_reordenamiento(nombre, metodo="fuerza_bruta"))
+
+    @unittest.skipIf(tipo.np is None, "NumPy no está instalado")
+    def test_reordenamiento_por_lotes_igual_a_evaluar_orden(self):
+        self.mt.agregar_tipo_atomico("char", 1, 2)
+        self.mt.agregar_tipo_atomico("int", 4, 4)
+        self.mt.agregar_tipo_atomico("raro", 5, 3)
+        self.mt.agregar_tipo_compuesto("foo", ["raro", "char", "int", "char"])
+        self.mt.agregar_tipo_compuesto("bar", ["raro", "foo", "int"], es_union=True)
+        self.mt.agregar_tipo_compuesto("foobar", ["foo", "char", "bar", "int", "raro", "char", "int"])
+        for nombre in ("foo", "bar", "foobar"):
+            with patch("tipo.TAMANO_LOTE", 7):
+                por_lotes = self.mt.mejor_reordenamiento(nombre, metodo="fuerza_bruta")
+            with patch("tipo.np", None):
+                secuencial = self.mt.mejor_reordenamiento(nombre, metodo="fuerza_bruta")
+            self.assertEqual(por_lotes, secuencial)
+            self.assertEqual(por_lotes, self.mt.mejor_reordenamiento(nombre, self.mt.evaluar_orden, "fuerza_bruta"))
+
+    @unittest.skipIf(tipo.np is None, "NumPy no está instalado")
+    def test_lotes_de_permutaciones_en_el_orden_de_permutaciones_distintas(self):
+        for clases in ([], [0, 1, 2, 3, 4], ["a", "b", "a", "c", "b", "a"], [(4, 4)] * 3 + [(1, 2)] * 2):
+            esperado = list(tipo.permutaciones_distintas(clases))
+            for tamano_lote in (1, 5, 7, 4096):
+                lotes = list(tipo.lotes_de_permutaciones(clases, tamano_lote))
+                self.assertTrue(all(len(lote) <= tamano_lote for lote in lotes))
+                filas = [tuple(int(i) for i in fila) for lote in lotes for fila in lote]
+                self.assertEqual(filas, esperado)
+
+    def test_reordenamiento_acotado(self):
+        self.mt.agregar_tipo_atomico("char", 1, 2)
+        self.mt.agregar_tipo_atomico("int", 4, 4)
+        self.mt.agregar_tipo_atomico("raro", 5, 3)
+        self.mt.agregar_tipo_compuesto("foo", ["raro", "char", "int", "char", "raro"])
+        self.mt.agregar_tipo_compuesto("foobar", ["foo", "char", "int", "raro"])
+        exacto = self.mt.mejor_reordenamiento("foobar", metodo="fuerza_bruta")
+        # Sin presupuesto se devuelve la heurística, sin demostrar
+        size, _, _, es_optimo = self.mt.mejor_reordenamiento("foobar", metodo="acotado", limite_evaluaciones=0)
+        self.assertGreaterEqual(size, exacto[0])
+        self.assertFalse(es_optimo)
+        # Con tiempo suficiente se demuestra el óptimo
+        resultado = self.mt.mejor_reordenamiento("foobar", metodo="acotado", limite_tiempo=10)
+        self.assertEqual(resultado, exacto + (True,))
+
+    def test_reordenamiento_acotado_respeta_el_plazo(self):
+        azar = random.Random(0)
+        for i in range(120):
+            self.mt.agregar_tipo_atomico(f"r{i}", azar.randint(1, 24), azar.choice((1, 2, 4, 8)))
+        self.mt.agregar_tipo_compuesto("ancho", [f"r{i}" for i in range(120)])
+        inicio = time.perf_counter()
+        *_, es_optimo = self.mt.mejor_reordenamiento("ancho", metodo="acotado", limite_tiempo=0.5)
+        self.assertLess(time.perf_counter() - inicio, 0.75)
+        self.assertFalse(es_optimo)
+        inicio = time.perf_counter()
+        *_, es_optimo = self.mt.mejor_reordenamiento("ancho", metodo="acotado", limite_evaluaciones=1000)
+        self.assertLess(time.perf_counter() - inicio, 0.5)
+        self.assertFalse(es_optimo)
+
+    def test_reordenamiento_dinamico_sin_demostrar(self):
+        # Con muchas clases distintas la programación dinámica agota LIMITE_PASOS_RELLENO
+        # y se devuelve el mejor orden heurístico, marcado como no demostrado
+        azar = random.Random(0)
+        for i in range(60):
+            self.mt.agregar_tipo_atomico(f"r{i}", azar.randint(1, 24), azar.choice((1, 2, 4, 8)))
+        self.mt.agregar_tipo_compuesto("ancho", [f"r{i}" for i in range(60)])
+        inicio = time.perf_counter()
+        tamano, _, desperdicio = self.mt.mejor_reordenamiento("ancho")
+        self.assertLess(time.perf_counter() - inicio, 5)
+        self.assertEqual(tamano - desperdicio, sum(self.mt.tipos[f"r{i}"].representacion for i in range(60)))
+        descripcion = self.mt.describir("ancho", ["tamano_optimo"])
+        self.assertFalse(descripcion.optimo_demostrado)
+        with patch('sys.stdout', new_callable=io.StringIO) as salida:
+            self.mt.describir_tipo("ancho")
+        self.assertIn("Óptimo demostrado: No", salida.getvalue())
+
+    def test_reordenamiento_acotado_sin_relleno_igual_a_fuerza_bruta(self):
+        self.mt.agregar_tipo_atomico("b", 4, 2)
+        self.mt.agregar_tipo_atomico("a", 4, 4)
+        self.mt.agregar_tipo_compuesto("s", ["b", "a"])
+        acotado = self.mt.mejor_reordenamiento("s", metodo="acotado", limite_tiempo=10)
+        nuevo = ManejadorTipos()
+        nuevo.importar_esquema([("ATOMICO", "b", 4, 2), ("ATOMICO", "a", 4, 4), ("STRUCT", "s", ["b", "a"])])
+        # La búsqueda local empieza por "a", pero el primer orden mínimo empieza por "b"
+        self.assertEqual(acotado, nuevo.mejor_reordenamiento("s", metodo="fuerza_bruta") + (True,))
+        self.assertEqual(acotado, (8, 2, 0, True))
+
+    @patch('builtins.input', side_effect=[
+        'ATOMICO char 1 2',
+        'ATOMICO int 4 4',
+        'STRUCT foo char int char',
+        'DESCRIBIR foo LIMITE 0.5',
+        'DESCRIBIR foo TOPE 0.5',
+        'SALIR'
+    ])
+    @patch('builtins.print')
+    def test_main_describir_con_limite(self, mock_print, mock_input):
+        main()
+        output = [call.args[0] for call in mock_print.call_args_list]
+        self.assertIn("Tamaño óptimo: 7 bytes", output)
+        self.assertIn("Óptimo demostrado: Sí", output)
+        self.assertIn("Error: faltan argumentos o hay argumentos de mas", output)
+
+    def test_mejor_reordenamiento_metodo_desconocido(self):
+        self.mt.agregar_tipo_atomico("char", 1, 2)
+        self.mt.agregar_tipo_compuesto("foo", ["char"])
+        with self.assertRaises(ValueError):
+            self.mt.mejor_reordenamiento("foo", metodo="magia")
+
+    # -----------------------------
+    # Caché de disposiciones: invalidación por dependencias y límite LRU
+    # -----------------------------
+    def test_cache_invalida_solo_dependientes(self):
+        self.mt.agregar_tipo_atomico("char", 1, 2)
+        self.mt.agregar_tipo_atomico("int", 4, 4)
+        self.mt.agregar_tipo_compuesto("foo", ["char", "int"])
+        self.mt.agregar_tipo_compuesto("bar", ["int", "int"])
+        self.mt.agregar_tipo_compuesto("foobar", ["foo", "bar"])
+        self.mt.size_alineacion("foobar")
+        self.assertIn(("foo", "original"), self.mt._cache)
+        self.mt.invalidar_tipo("foo")
+        self.assertNotIn(("foo", "original"), self.mt._cache)
+        self.assertNotIn(("foobar", "original"), self.mt._cache)
+        self.assertIn(("bar", "original"), self.mt._cache)
+
+    def test_cache_limite_lru(self):
+        mt = ManejadorTipos(limite_cache=2)
+        mt.agregar_tipo_atomico("int", 4, 4)
+        for nombre in ("a", "b", "c"):
+            mt.agregar_tipo_compuesto(nombre, ["int"])
+            mt.size_alineacion(nombre)
+        self.assertEqual(list(mt._cache), [("b", "original"), ("c", "original")])
+
+    def test_cache_resultado_igual_al_calculo(self):
+        self.mt.agregar_tipo_atomico("char", 1, 2)
+        self.mt.agregar_tipo_atomico("raro", 5, 3)
+        self.mt.agregar_tipo_compuesto("foo", ["char", "raro"])
+        self.mt.agregar_tipo_compuesto("u", ["foo", "raro"], es_union=True)
+        primero = self.mt.size_alineacion("u", es_union=True, optimo=True)
+        self.assertEqual(primero, self.mt.size_alineacion("u", es_union=True, optimo=True))
+        self.assertEqual(primero, self.mt.evaluar_orden(["foo", "raro"], es_union=True, optimo=True))
+
+    # -----------------------------
+    # evaluar_orden: evaluación sin efectos sobre la tabla de tipos
+    # -----------------------------
+    def test_evaluar_orden_no_modifica_tabla(self):
+        self.mt.agregar_tipo_atomico("char", 1, 2)
+        self.mt.agregar_tipo_atomico("int", 4, 4)
+        self.mt.agregar_tipo_compuesto("foo", ["char", "int"])
+        tipo = self.mt.tipos["foo"]
+        self.assertEqual(self.mt.evaluar_orden(["int", "char"]), (5, 5, 4, 4, 0))
+        self.assertEqual(self.mt.evaluar_orden(("char", "int")), self.mt.size_alineacion("foo"))
+        self.assertIs(self.mt.tipos["foo"], tipo)
+        self.assertEqual(tipo.campos, ["char", "int"])
+
+    def test_mejor_reordenamiento_concurrente(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self.mt.agregar_tipo_atomico("char", 1, 2)
+        self.mt.agregar_tipo_atomico("int", 4, 4)
+        self.mt.agregar_tipo_atomico("raro", 5, 3)
+        self.mt.agregar_tipo_compuesto("foo", ["char", "int", "raro", "char", "int"])
+        self.mt.agregar_tipo_compuesto("bar", ["raro", "raro", "char", "int", "char"])
+        esperado = {n: self.mt.mejor_reordenamiento(n, metodo="fuerza_bruta") for n in ("foo", "bar")}
+        with ThreadPoolExecutor(max_workers=4) as ejecutor:
+            nombres = ["foo", "bar"] * 8
+            obtenidos = list(ejecutor.map(lambda n: self.mt.mejor_reordenamiento(n, metodo="fuerza_bruta"), nombres))
+        self.assertEqual(obtenidos, [esperado[n] for n in nombres])
+        self.assertEqual(self.mt.tipos["foo"].campos, ["char", "int", "raro", "char", "int"])
+
+    # -----------------------------
+    # Tabla compacta: mismos resultados con nombres internados y arreglos
+    # -----------------------------
+    def test_tabla_compacta_igual_a_diccionario(self):
+        compacto = ManejadorTipos(compacto=True)
+        self.assertIsInstance(compacto.tipos, TablaTipos)
+        for mt in (self.mt, compacto):
+            mt.agregar_tipo_atomico("char", 1, 2)
+            mt.agregar_tipo_atomico("int", 4, 4)
+            mt.agregar_tipo_atomico("raro", 5, 3)
+            mt.agregar_tipo_compuesto("foo", ["char", "int", "raro"])
+            mt.agregar_tipo_compuesto("bar", ["char", "int", "raro"], es_union=True)
+            mt.agregar_tipo_compuesto("foobar", ["foo", "bar", "int"])
+        for nombre in ("foo", "bar", "foobar"):
+            es_union = self.mt.es_union(nombre)
+            self.assertEqual(compacto.es_union(nombre), es_union)
+            self.assertEqual(compacto.size_alineacion(nombre, es_union), self.mt.size_alineacion(nombre, es_union))
+            self.assertEqual(compacto.mejor_reordenamiento(nombre), self.mt.mejor_reordenamiento(nombre))
+
+    @patch('builtins.print')
+    def test_tabla_compacta_api_por_nombre(self, mock_print):
+        mt = ManejadorTipos(compacto=True)
+        mt.agregar_tipo_atomico("char", 1, 2)
+        mt.agregar_tipo_atomico("int", 4, 4)
+        mt.agregar_tipo_compuesto("foo", ["char", "int"])
+        mt.agregar_tipo_compuesto("foo", ["char"])
+        mock_print.assert_any_call("Error: el tipo 'foo' ya existe.")
+        self.assertEqual(list(mt.tipos), ["char", "int", "foo"])
+        self.assertEqual(mt.tipos["foo"].campos, ["char", "int"])
+        self.assertEqual(mt.tipos["int"].representacion, 4)
+        # En modo compacto los campos también pueden darse por id
+        ids = [mt.tipos.ids["int"], mt.tipos.ids["char"]]
+        self.assertEqual(mt.evaluar_orden(ids), mt.evaluar_orden(["int", "char"]))
+
+    def test_tabla_compacta_ahorra_memoria(self):
+        definiciones = [("ATOMICO", "char", 1, 1), ("ATOMICO", "int", 4, 4), ("ATOMICO", "double", 8, 8)]
+        definiciones += [("STRUCT", f"s{i}", ["char", "int", "double", "int", "char", "double"])
+                         for i in range(3000)]
+        memoria = {}
+        for compacto in (False, True):
+            tracemalloc.start()
+            mt = ManejadorTipos(compacto=compacto)
+            mt.importar_esquema(definiciones)
+            memoria[compacto] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+        # Sin un conjunto de dependientes por tipo, la tabla compacta ocupa mucho menos
+        self.assertLess(memoria[True], memoria[False] / 2)
+        # El índice inverso se arma en la primera invalidación y sigue las redefiniciones
+        mt.agregar_tipo_compuesto("par", ["s1", "s2"])
+        mt.size_alineacion("par", False)
+        self.assertIn(("par", "original"), mt.invalidar_tipo("double"))
+        mt.redefinir_tipo_compuesto("par", ["s3"])
+        mt.size_alineacion("par", False)
+        self.assertEqual(mt.invalidar_tipo("s1"), [])
+        self.assertIn(("par", "original"), mt.invalidar_tipo("s3"))
+
+    # -----------------------------
+    # Importación masiva de esquemas
+    # -----------------------------
+    def test_importar_esquema_referencias_adelante(self):
+        errores = self.mt.importar_esquema([
+            ("STRUCT", "foobar", ["foo", "bar", "int"]),
+            ("UNION", "bar", ["char", "int"]),
+            ("STRUCT", "foo", ["char", "int"]),
+            ("ATOMICO", "char", 1, 2),
+            ("ATOMICO", "int", 4, 4),
+        ])
+        self.assertEqual(errores, [])
+        self.assertTrue(self.mt.es_union("bar"))
+        self.assertEqual(self.mt.tipos["foobar"].campos, ["foo", "bar", "int"])
+        self.assertEqual(self.mt.size_alineacion("foobar")[0], 13)
+
+    def test_importar_esquema_errores_sin_cambios(self):
+        self.mt.agregar_tipo_atomico("char", 1, 2)
+        errores = self.mt.importar_esquema([
+            ("ATOMICO", "char", 1, 2),
+            ("ATOMICO", "int", 4, 4),
+            ("STRUCT", "a", ["b", "int"]),
+            ("STRUCT", "b", ["a"]),
+            ("STRUCT", "c", ["nada"]),
+        ])
+        self.assertIn("Error: el tipo 'char' ya existe.", errores)
+        self.assertIn("Error: el tipo 'nada' no está definido.", errores)
+        self.assertTrue(any("cíclicas" in e and "a" in e and "b" in e for e in errores))
+        self.assertEqual(list(self.mt.tipos), ["char"])
+
+    def test_cargar_esquema_json_jsonl_y_comandos(self):
+        objetos = [{"tipo": "STRUCT", "nombre": "foo", "campos": ["char", "int"]},
+                   {"tipo": "ATOMICO", "nombre": "char", "representacion": 1, "alineacion": 2},
+                   {"tipo": "ATOMICO", "nombre": "int", "representacion": 4, "alineacion": 4}]
+        with tempfile.TemporaryDirectory() as carpeta:
+            contenidos = {"esquema.json": json.dumps(objetos),
+                          "esquema.jsonl": "\n".join(json.dumps(o) for o in objetos),
+                          "esquema.txt": "STRUCT foo char int\nATOMICO char 1 2\n\nATOMICO int 4 4\n"}
+            for archivo, contenido in contenidos.items():
+                ruta = os.path.join(carpeta, archivo)
+                with open(ruta, "w", encoding="utf-8") as f:
+                    f.write(contenido)
+                mt = ManejadorTipos()
+                self.assertEqual(mt.cargar_esquema(ruta), [])
+                self.assertEqual(mt.size_alineacion("foo"), (5, 8, 2, 2, 3))
+            errores = self.mt.cargar_esquema(os.path.join(carpeta, "no_existe.txt"))
+        self.assertEqual(len(errores), 1)
+        self.assertTrue(errores[0].startswith("Error: no se pudo leer el esquema"))
+
     # -----------------------------
     # describir_tipo y describir_registro: impresión
     # -----------------------------
@@ -189,6 +533,519 @@ class TestManejadorTiposAltaCobertura(unittest.TestCase):
         self.assertTrue(any("Tamaño óptimo:" in s for s in output))
         self.assertIn("Saliendo", output)
 
+    @patch('builtins.input', side_effect=['ATOMICO char 1 2', '', EOFError])
+    @patch('builtins.print')
+    def test_main_interactivo_sin_salir(self, mock_print, mock_input):
+        main()  # No debe fallar al terminarse la entrada sin SALIR
+        self.assertEqual(mock_input.call_count, 3)
+        mock_print.assert_not_called()
+
+    # -----------------------------
+    # Modo por lotes: ejecutar_script
+    # -----------------------------
+    def test_ejecutar_script_salida_y_errores_numerados(self):
+        entrada = io.StringIO("ATOMICO char 1 2\nATOMICO int 4 4\n\nSTRUCT foo char int\n"
+                              "STRUCT bar nada\nATOMICO x uno 1\nDESCRIBIR foo\nBORRAR foo\n")
+        salida = io.StringIO()
+        errores = ejecutar_script(self.mt, entrada, salida, numerar_errores=True)
+        self.assertEqual(errores, ["Línea 5: Error: el tipo 'nada' no está definido.",
+                                   "Línea 6: Error: la representación y la alineación deben ser enteros",
+                                   "Línea 8: Error: acción 'BORRAR' desconocida"])
+        self.assertIn("Tipo Struct: foo\n", salida.getvalue())
+        self.assertNotIn("Error", salida.getvalue())
+
+    def test_ejecutar_script_errores_en_linea_y_salir(self):
+        entrada = io.StringIO("ATOMICO char 1 2\nATOMICO char 1 2\nSALIR\nDESCRIBIR char\n")
+        salida = io.StringIO()
+        self.assertEqual(ejecutar_script(self.mt, entrada, salida), [])
+        self.assertEqual(salida.getvalue(), "Error: el tipo 'char' ya existe.\nSaliendo\n")
+
+    # -----------------------------
+    # Caché persistente en disco
+    # -----------------------------
+    def test_cache_persistente_entre_procesos(self):
+        def construir(ruta, alineacion_int=4):
+            mt = ManejadorTipos(instrumentado=True, cache_persistente=ruta)
+            mt.agregar_tipo_atomico("char", 1, 2)
+            mt.agregar_tipo_atomico("int", 4, alineacion_int)
+            mt.agregar_tipo_compuesto("foo", ["char", "int", "char"])
+            mt.agregar_tipo_compuesto("bar", ["foo", "int"])
+            return mt
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, "cache.sqlite")
+            mt = construir(ruta)
+            esperado = mt.mejor_reordenamiento("bar"), mt.size_alineacion("bar")
+            mt.cerrar()
+            # Un manejador nuevo reutiliza los resultados guardados
+            mt = construir(ruta)
+            self.assertEqual((mt.mejor_reordenamiento("bar"), mt.size_alineacion("bar")), esperado)
+            self.assertEqual(mt.estadisticas()["aciertos_cache_persistente"], 2)
+            mt.cerrar()
+            # Si cambia un subtipo cambia la huella y se recalcula
+            mt = construir(ruta, alineacion_int=8)
+            self.assertNotEqual(mt.huella_tipo("bar"), construir(":memory:").huella_tipo("bar"))
+            mt.mejor_reordenamiento("bar")
+            self.assertEqual(mt.estadisticas()["aciertos_cache_persistente"], 0)
+            mt.cerrar()
+
+    def test_huella_independiente_de_nombres(self):
+        self.mt.agregar_tipo_atomico("a", 4, 4)
+        self.mt.agregar_tipo_atomico("b", 4, 4)
+        self.mt.agregar_tipo_compuesto("x", ["a", "b"])
+        self.mt.agregar_tipo_compuesto("y", ["b", "a"])
+        self.mt.agregar_tipo_compuesto("z", ["b", "a"], es_union=True)
+        self.assertEqual(self.mt.huella_tipo("x"), self.mt.huella_tipo("y"))
+        self.assertNotEqual(self.mt.huella_tipo("x"), self.mt.huella_tipo("z"))
+
+    # -----------------------------
+    # Redefinición de tipos con recálculo incremental
+    # -----------------------------
+    def test_redefinir_recalcula_solo_dependientes(self):
+        for mt in (self.mt, ManejadorTipos(compacto=True)):
+            mt.agregar_tipo_atomico("char", 1, 2)
+            mt.agregar_tipo_atomico("int", 4, 4)
+            mt.agregar_tipo_compuesto("foo", ["char", "int"])
+            mt.agregar_tipo_compuesto("bar", ["int", "int"])
+            mt.agregar_tipo_compuesto("foobar", ["foo", "bar"])
+            mt.size_alineacion("foobar")
+            mt.mejor_reordenamiento("foobar")
+            anterior_bar = mt._cache[("bar", "original")]
+            mt.redefinir_tipo_atomico("char", 2, 2)
+            # Los afectados ya están recalculados y los demás no se tocaron
+            self.assertEqual(mt._cache[("foo", "original")], (6, 8, 2, 2, 2))
+            self.assertIs(mt._cache[("bar", "original")], anterior_bar)
+            self.assertEqual(mt.size_alineacion("foobar"), mt.evaluar_orden(["foo", "bar"]))
+            self.assertEqual(mt.mejor_reordenamiento("foobar"), mt.mejor_reordenamiento("foobar", metodo="fuerza_bruta"))
+            mt.redefinir_tipo_compuesto("foo", ["int"], es_union=True)
+            self.assertTrue(mt.es_union("foo"))
+            self.assertEqual(mt.size_alineacion("foobar")[0], 12)
+
+    @patch('builtins.print')
+    def test_redefinir_rechaza_ciclos_e_inexistentes(self, mock_print):
+        self.mt.agregar_tipo_atomico("int", 4, 4)
+        self.mt.agregar_tipo_compuesto("foo", ["int"])
+        self.mt.agregar_tipo_compuesto("bar", ["foo"])
+        self.mt.redefinir_tipo_compuesto("foo", ["bar"])
+        mock_print.assert_any_call("Error: redefinir 'foo' con el campo 'bar' crearía un ciclo.")
+        self.mt.redefinir_tipo_compuesto("foo", ["foo"])
+        mock_print.assert_any_call("Error: redefinir 'foo' con el campo 'foo' crearía un ciclo.")
+        self.mt.redefinir_tipo_atomico("nada", 1, 1)
+        mock_print.assert_any_call("Error: el tipo 'nada' no está definido.")
+        self.assertEqual(self.mt.tipos["foo"].campos, ["int"])
+
+    @patch('builtins.input', side_effect=[
+        'ATOMICO char 1 2',
+        'ATOMICO int 4 4',
+        'STRUCT foo char int',
+        'REDEFINIR STRUCT foo int char int',
+        'REDEFINIR ATOMICO char 1',
+        'DESCRIBIR foo',
+        'SALIR'
+    ])
+    @patch('builtins.print')
+    def test_main_redefinir(self, mock_print, mock_input):
+        main()
+        output = [call.args[0] for call in mock_print.call_args_list]
+        self.assertIn("Tamaño empaquetado: 9 bytes", output)
+        self.assertIn("Error: faltan argumentos o hay argumentos de mas", output)
+
+    # -----------------------------
+    # Instrumentación y comando STATS
+    # -----------------------------
+    def test_estadisticas_contadores_y_observadores(self):
+        mt = ManejadorTipos(instrumentado=True)
+        eventos = []
+        mt.agregar_observador(lambda evento, datos: eventos.append((evento, datos["nombre"])))
+        mt.agregar_tipo_atomico("char", 1, 2)
+        mt.agregar_tipo_atomico("int", 4, 4)
+        mt.agregar_tipo_compuesto("foo", ["char", "int"])
+        mt.agregar_tipo_compuesto("bar", ["foo", "int", "char"])
+        mt.size_alineacion("bar")
+        mt.size_alineacion("bar")
+        mt.mejor_reordenamiento("bar", metodo="fuerza_bruta")
+        estadisticas = mt.estadisticas()
+        self.assertGreaterEqual(estadisticas["llamadas_size_alineacion"], 2)
+        # Los subtipos se calculan de abajo hacia arriba, sin llamadas anidadas
+        self.assertEqual(estadisticas["profundidad_maxima"], 1)
+        self.assertEqual(estadisticas["permutaciones_evaluadas"], 6)
+        self.assertGreaterEqual(estadisticas["aciertos_cache"], 1)
+        self.assertGreaterEqual(estadisticas["fallos_cache"], 2)
+        self.assertIn(("mejor_reordenamiento", "bar"), eventos)
+        mt.reiniciar_estadisticas()
+        self.assertEqual(mt.estadisticas()["llamadas_size_alineacion"], 0)
+
+    def test_estadisticas_desactivadas(self):
+        self.mt.agregar_tipo_atomico("int", 4, 4)
+        self.mt.agregar_tipo_compuesto("foo", ["int", "int"])
+        self.mt.mejor_reordenamiento("foo", metodo="fuerza_bruta")
+        estadisticas = self.mt.estadisticas()
+        self.assertEqual(estadisticas["permutaciones_evaluadas"], 0)
+        self.assertEqual(estadisticas["llamadas_size_alineacion"], 0)
+
+    @patch('builtins.input', side_effect=[
+        'STATS',
+        'STATS ACTIVAR',
+        'ATOMICO int 4 4',
+        'STRUCT foo int int',
+        'DESCRIBIR foo',
+        'BORRAR foo',
+        'LIMPIAR',
+        'STATS',
+        'STATS REINICIAR',
+        'STATS BORRAR',
+        'SALIR'
+    ])
+    @patch('builtins.print')
+    def test_main_stats(self, mock_print, mock_input):
+        main()
+        output = [call.args[0] for call in mock_print.call_args_list]
+        # Sin --estadisticas la instrumentación empieza apagada
+        self.assertEqual(output[0], "Instrumentación: inactiva")
+        self.assertIn("Instrumentación: activa", output)
+        self.assertTrue(any(s.startswith("Llamadas a size_alineacion: ") for s in output))
+        self.assertTrue(any(s.startswith("Comando DESCRIBIR: 1 veces") for s in output))
+        # Los comandos desconocidos se acumulan en una sola entrada
+        self.assertTrue(any(s.startswith("Comando (desconocido): 2 veces") for s in output))
+        self.assertFalse(any(s.startswith("Comando BORRAR") for s in output))
+        self.assertIn("Error: faltan argumentos o hay argumentos de mas", output)
+
+    @patch('builtins.input', side_effect=['STATS', 'SALIR'])
+    @patch('builtins.print')
+    def test_main_stats_con_opcion(self, mock_print, mock_input):
+        main(["--estadisticas"])
+        self.assertEqual(mock_print.call_args_list[0].args[0], "Instrumentación: activa")
+
+    # -----------------------------
+    # Banco de pruebas de rendimiento
+    # -----------------------------
+    def test_rendimiento_generadores_y_comparacion(self):
+        for generador in rendimiento.GENERADORES:
+            resultado = rendimiento.medir("size_alineacion", generador, 5, repeticiones=1)
+            self.assertGreater(resultado["evaluaciones"], 0)
+            self.assertGreaterEqual(resultado["memoria_pico"], 0)
+        base = {"resultados": [dict(resultado, segundos=1.0)]}
+        actual = {"resultados": [dict(resultado, segundos=1.5)]}
+        self.assertEqual(rendimiento.comparar(base, actual, tolerancia=0.2),
+                         [("size_alineacion", "compartidos", 5, 1.0, 1.5)])
+        self.assertEqual(rendimiento.comparar(base, actual, tolerancia=0.6), [])
+
+    # -----------------------------
+    # Descripción perezosa y selectiva
+    # -----------------------------
+    def test_describir_perezoso(self):
+        mt = ManejadorTipos(instrumentado=True)
+        mt.agregar_tipo_atomico("char", 1, 2)
+        mt.agregar_tipo_atomico("int", 4, 4)
+        mt.agregar_tipo_compuesto("foo", ["char", "int", "char"])
+        descripcion = mt.describir("foo", ["tamano_empaquetado", "alineacion_no_empaquetado"])
+        self.assertEqual(mt.estadisticas()["llamadas_size_alineacion"], 0)
+        self.assertEqual(descripcion.tamano_empaquetado, 6)
+        self.assertEqual(descripcion.alineacion_no_empaquetado, 2)
+        self.assertEqual(mt.estadisticas()["llamadas_size_alineacion"], 1)
+        self.assertEqual(mt.estadisticas()["llamadas_mejor_reordenamiento"], 0)
+        with self.assertRaises(AttributeError):
+            _ = descripcion.tamano_optimo
+        self.assertEqual(descripcion.como_diccionario(), {"tamano_empaquetado": 6, "alineacion_no_empaquetado": 2})
+        completa = mt.describir("foo")
+        self.assertEqual((completa.tamano_optimo, completa.clase), (7, "STRUCT"))
+        self.assertEqual(mt.describir("int").tamano_no_empaquetado, 4)
+        with self.assertRaises(ValueError):
+            mt.describir("foo", ["tamano"])
+        with self.assertRaises(KeyError):
+            mt.describir("nada")
+
+    @patch('builtins.input', side_effect=[
+        'ATOMICO char 1 2',
+        'ATOMICO int 4 4',
+        'STRUCT foo char int char',
+        'DESCRIBIR foo SOLO tamano_empaquetado desperdicio_no_empaquetado',
+        'DESCRIBIR foo LIMITE 1 SOLO tamano_optimo',
+        'DESCRIBIR foo SOLO tamano',
+        'DESCRIBIR foo SOLO',
+        'SALIR'
+    ])
+    @patch('builtins.print')
+    def test_main_describir_solo(self, mock_print, mock_input):
+        main()
+        output = [call.args[0] for call in mock_print.call_args_list]
+        self.assertEqual(output[:5], ["Tamaño empaquetado: 6 bytes", "Bytes desperdiciados (no empaquetado): 3 bytes",
+                                      "Tamaño óptimo: 7 bytes", "Óptimo demostrado: Sí",
+                                      "Error: métrica 'tamano' desconocida"])
+        self.assertIn("Error: faltan argumentos o hay argumentos de mas", output)
+
+    # -----------------------------
+    # Descripción de todo el esquema en una pasada
+    # -----------------------------
+    def test_describir_todos_igual_a_describir(self):
+        mt = ManejadorTipos(instrumentado=True, limite_cache=0)
+        mt.importar_esquema(rendimiento.generar_compartidos(20, rendimiento.random.Random(3)))
+        filas = list(mt.describir_todos())
+        self.assertEqual(len(filas), len(mt.tipos))
+        sin_limite = ManejadorTipos()
+        sin_limite.importar_esquema(rendimiento.generar_compartidos(20, rendimiento.random.Random(3)))
+        for _ in sin_limite.describir_todos():
+            pass
+        self.assertEqual(len(sin_limite._cache), 0)
+        self.assertEqual(mt.estadisticas()["llamadas_size_alineacion"], 0)
+        posiciones = {fila.nombre: i for i, fila in enumerate(filas)}
+        for fila in filas:
+            if fila.clase != "ATOMICO":
+                for campo in mt.tipos[fila.nombre].campos:
+                    self.assertLess(posiciones[campo], posiciones[fila.nombre])
+            self.assertEqual(fila.como_diccionario(), mt.describir(fila.nombre).como_diccionario())
+        solo = list(mt.describir_todos(["registro3"], ["tamano_no_empaquetado"]))
+        self.assertEqual([fila.nombre for fila in solo], ["registro3"])
+        self.assertEqual(solo[0].como_diccionario(),
+                         {"tamano_no_empaquetado": mt.describir("registro3").tamano_no_empaquetado})
+
+    @patch('builtins.input', side_effect=[
+        'ATOMICO char 1 2',
+        'ATOMICO int 4 4',
+        'STRUCT foo char int char',
+        'UNION bar foo int',
+        'DESCRIBIR_TODO bar SOLO tamano_optimo alineacion_optimo',
+        'DESCRIBIR_TODO',
+        'DESCRIBIR_TODO nada',
+        'SALIR'
+    ])
+    @patch('builtins.print')
+    def test_main_describir_todo(self, mock_print, mock_input):
+        main()
+        output = [call.args[0] for call in mock_print.call_args_list]
+        self.assertEqual(json.loads(output[0]), {"nombre": "bar", "clase": "UNION",
+                                                 "tamano_optimo": 7, "alineacion_optimo": 4})
+        self.assertEqual([json.loads(linea)["nombre"] for linea in output[1:5]], ["char", "int", "foo", "bar"])
+        self.assertEqual(json.loads(output[3])["tamano_no_empaquetado"], 9)
+        self.assertEqual(output[5], "Error: el tipo 'nada' no está definido.")
+
+    # -----------------------------
+    # Mapas de desplazamientos y exportación por columnas
+    # -----------------------------
+    def _esquema_desplazamientos(self):
+        self.mt.agregar_tipo_atomico("char", 1, 2)
+        self.mt.agregar_tipo_atomico("int", 4, 4)
+        self.mt.agregar_tipo_compuesto("foo", ["char", "int", "char"])
+        self.mt.agregar_tipo_compuesto("u", ["foo", "int"], es_union=True)
+        self.mt.agregar_tipo_compuesto("bar", ["u", "char", "foo"])
+
+    def test_desplazamientos(self):
+        self._esquema_desplazamientos()
+        mapa = self.mt.desplazamientos("foo")
+        self.assertEqual(mapa["empaquetado"], [(0, "char", 0, 0), (1, "int", 1, 0), (2, "char", 5, 0)])
+        self.assertEqual(mapa["no_empaquetado"], [(0, "char", 0, 0), (1, "int", 4, 3), (2, "char", 8, 0)])
+        self.assertEqual(mapa["optimo"], [(1, "int", 0, 0), (0, "char", 4, 0), (2, "char", 6, 1)])
+        self.assertEqual(self.mt.desplazamientos("u")["no_empaquetado"], [(0, "foo", 0, 0), (1, "int", 0, 0)])
+        # El último campo termina en el tamaño de cada disposición
+        mapa = self.mt.desplazamientos("bar")
+        emp, no_emp, _, _, _ = self.mt.size_alineacion("bar")
+        size_optimo, _, _ = self.mt.mejor_reordenamiento("bar")
+        self.assertEqual(mapa["no_empaquetado"][-1][2] + self.mt.size_alineacion("foo")[1], no_emp)
+        self.assertEqual(mapa["empaquetado"][-1][2] + self.mt.size_alineacion("foo")[0], emp)
+        self.assertEqual(mapa["optimo"][-1][2] + 1, size_optimo)
+        registro = []
+        self.assertEqual(self.mt.evaluar_orden(["u", "char", "foo"], registro=registro), self.mt.size_alineacion("bar"))
+        self.assertEqual([fila[1] for fila in registro], [0, 10, 12])
+        with self.assertRaises(TypeError):
+            self.mt.desplazamientos("int")
+
+    def test_exportar_desplazamientos(self):
+        self._esquema_desplazamientos()
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta_binaria = os.path.join(directorio, "desplazamientos.bin")
+            ruta_csv = os.path.join(directorio, "desplazamientos.csv")
+            self.assertEqual(self.mt.exportar_desplazamientos(ruta_binaria), 24)
+            columnas = tipo.leer_desplazamientos(ruta_binaria)
+            self.assertEqual(self.mt.exportar_desplazamientos(ruta_csv, ["bar"]), 9)
+            with open(ruta_csv, encoding="utf-8") as archivo:
+                lineas = archivo.read().splitlines()
+        self.assertEqual(len(columnas["tipo"]), 24)
+        filas = list(zip(*(columnas[c] for c in ("tipo", "disposicion", "posicion", "campo", "desplazamiento", "relleno"))))
+        self.assertIn(("foo", "optimo", 2, "char", 6, 1), filas)
+        self.assertIn(("bar", "no_empaquetado", 2, "foo", 12, 1), filas)
+        self.assertEqual(lineas[0], "tipo,disposicion,posicion,campo,desplazamiento,relleno")
+        self.assertEqual(lineas[1:4], ["bar,empaquetado,0,u,0,0", "bar,empaquetado,1,char,6,0", "bar,empaquetado,2,foo,7,0"])
+
+    @patch('builtins.print')
+    def test_comando_exportar(self, mock_print):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, "foo.csv")
+            errores = ejecutar_script(self.mt, ["ATOMICO int 4 4", "STRUCT foo int int",
+                                                f"EXPORTAR {ruta} foo", "EXPORTAR x.csv int", "EXPORTAR"],
+                                      salida=io.StringIO(), numerar_errores=True)
+            with open(ruta, encoding="utf-8") as archivo:
+                self.assertEqual(len(archivo.read().splitlines()), 7)
+        self.assertEqual(errores, ["Línea 4: Error: el tipo 'int' no es un compuesto definido.",
+                                   "Línea 5: Error: faltan argumentos o hay argumentos de mas"])
+
+    # -----------------------------
+    # Permutaciones de multiconjuntos en la fuerza bruta
+    # -----------------------------
+    def test_permutaciones_distintas_como_itertools(self):
+        clases = ("a", "b", "a", "c", "b")
+        esperado = []
+        vistos = set()
+        for perm in itertools.permutations(range(len(clases))):
+            patron = tuple(clases[i] for i in perm)
+            if patron not in vistos:
+                vistos.add(patron)
+                esperado.append(perm)
+        self.assertEqual(list(tipo.permutaciones_distintas(clases)), esperado)
+        self.assertEqual(list(tipo.permutaciones_distintas(clases, prefijo=(1,))),
+                         [perm for perm in esperado if perm[0] == 1])
+
+    def test_fuerza_bruta_campos_repetidos(self):
+        mt = ManejadorTipos(instrumentado=True)
+        mt.agregar_tipo_atomico("int", 4, 4)
+        mt.agregar_tipo_atomico("char", 1, 1)
+        mt.agregar_tipo_compuesto("registro", ["int"] * 10 + ["char"] * 2)
+        self.assertEqual(mt.mejor_reordenamiento("registro", metodo="fuerza_bruta"), (42, 4, 0))
+        self.assertEqual(mt.estadisticas()["permutaciones_evaluadas"], 66)
+        mt.reiniciar_estadisticas()
+        resultado = mt.mejor_reordenamiento("registro", metodo="fuerza_bruta", funcion_evaluadora=mt.evaluar_orden)
+        self.assertEqual(resultado, (42, 4, 0))
+        self.assertEqual(mt.estadisticas()["permutaciones_evaluadas"], 66)
+
+    # -----------------------------
+    # Evaluación de abajo hacia arriba (anidamiento profundo)
+    # -----------------------------
+    def test_anidamiento_miles_de_niveles(self):
+        niveles = 5000
+        for compacto in (False, True):
+            mt = ManejadorTipos(compacto=compacto)
+            definiciones = [("ATOMICO", "char", 1, 1), ("ATOMICO", "int", 4, 4),
+                            ("STRUCT", "nivel0", ["char", "int"])]
+            definiciones += [("UNION" if i % 7 == 0 else "STRUCT", f"nivel{i}", [f"nivel{i - 1}", "char", "int"])
+                             for i in range(1, niveles)]
+            self.assertEqual(mt.importar_esquema(definiciones), [])
+            raiz = f"nivel{niveles - 1}"
+            # Modo acotado, DESCRIBIR con LIMITE y verificar, cada uno con la caché vacía
+            acotado = mt.mejor_reordenamiento(raiz, metodo="acotado", limite_tiempo=60)
+            self.assertTrue(acotado[3])
+            con_limite = ManejadorTipos(compacto=compacto)
+            con_limite.importar_esquema(definiciones)
+            salida = io.StringIO()
+            ejecutar_script(con_limite, [f"DESCRIBIR {raiz} LIMITE 60"], salida)
+            self.assertIn(f"Tamaño óptimo: {acotado[0]} bytes", salida.getvalue())
+            self.assertIn("Óptimo demostrado: Sí", salida.getvalue())
+            verificado = ManejadorTipos(compacto=compacto)
+            verificado.importar_esquema(definiciones)
+            self.assertEqual(verificado.mejor_reordenamiento(raiz, verificar=True), acotado[:3])
+            emp, no_emp, _, _, bits = mt.size_alineacion(raiz, mt.es_union(raiz))
+            self.assertGreater(no_emp, emp)
+            size, alineacion, bits_optimo = mt.mejor_reordenamiento(raiz)
+            self.assertLessEqual(size, no_emp)
+            self.assertLessEqual(bits_optimo, bits)
+            self.assertEqual(mt.size_alineacion(raiz, mt.es_union(raiz), optimo=True)[1],
+                             mt.evaluar_orden(mt.tipos[raiz].campos, mt.es_union(raiz), True)[1])
+            self.assertEqual(len(mt.huella_tipo(raiz)), 64)
+            # Un nivel intermedio ya quedó en la caché con el mismo resultado que al calcularlo solo
+            intermedio = ManejadorTipos()
+            intermedio.importar_esquema(definiciones[:103])
+            self.assertEqual(mt._cache[("nivel100", "optimo")], intermedio.mejor_reordenamiento("nivel100"))
+
+    # -----------------------------
+    # Servidor de consultas asyncio
+    # -----------------------------
+    def _conversar(self, servidor_tipos, lineas, respuestas):
+        async def conversar():
+            conexiones = await servidor_tipos.iniciar(puerto=0)
+            puerto = conexiones.sockets[0].getsockname()[1]
+            lector, escritor = await asyncio.open_connection("127.0.0.1", puerto)
+            for linea in lineas:
+                if linea is None: # Pausa para que el servidor llegue a procesar lo anterior
+                    await asyncio.sleep(0.5)
+                    continue
+                escritor.write(linea.encode() + b"\n")
+            await escritor.drain()
+            recibidas = [json.loads(await lector.readline()) for _ in range(respuestas)]
+            escritor.close()
+            conexiones.close()
+            await conexiones.wait_closed()
+            return {respuesta["id"]: respuesta for respuesta in recibidas}
+        try:
+            return asyncio.run(conversar())
+        finally:
+            servidor_tipos.cerrar()
+
+    def test_servidor_respuestas_json(self):
+        respuestas = self._conversar(servidor.ServidorTipos(trabajadores=1), [
+            "ATOMICO char 1 1",
+            "ATOMICO int 4 4",
+            "STRUCT s char int char",
+            "ATOMICO char 1 1",
+            "DESCRIBIR s",
+            "DESCRIBIR s",
+            "DESCRIBIR int",
+            "DESCRIBIR s SOLO tamano_empaquetado",
+            "SALIR",
+        ], 9)
+        self.assertTrue(respuestas[1]["ok"])
+        self.assertEqual(respuestas[4], {"id": 4, "ok": False, "salida": [],
+                                         "errores": ["Error: el tipo 'char' ya existe."]})
+        self.assertEqual(respuestas[5]["resultado"]["tamano_optimo"], 6)
+        self.assertEqual(respuestas[5]["resultado"]["tamano_no_empaquetado"], 9)
+        self.assertEqual(respuestas[6]["resultado"], respuestas[5]["resultado"])
+        self.assertEqual(respuestas[7]["resultado"]["clase"], "ATOMICO")
+        self.assertEqual(respuestas[8]["resultado"], {"nombre": "s", "clase": "STRUCT", "tamano_empaquetado": 6})
+        self.assertEqual(respuestas[9]["salida"], ["Saliendo"])
+
+    def test_servidor_cancelar_busqueda(self):
+        # 40 structs de 40 campos de tamaños variados: cada uno agota el presupuesto
+        # de la programación dinámica y juntos tardan mucho más que la prueba
+        rng = random.Random(0)
+        atomicos = [f"ATOMICO a{i} {rng.randint(1, 24)} {rng.choice([1, 2, 4, 8])}" for i in range(40)]
+        nombres = [f"a{i}" for i in range(40)]
+        structs = [f"STRUCT s{k} " + " ".join(nombres[k:] + nombres[:k]) for k in range(40)]
+        servidor_tipos = servidor.ServidorTipos(trabajadores=1)
+        inicio = time.monotonic()
+        respuestas = self._conversar(servidor_tipos, atomicos + structs + [
+            "STRUCT r " + " ".join(f"s{k}" for k in range(40)),
+            "DESCRIBIR r",
+            None,
+            "CANCELAR 82",
+            "CANCELAR 99",
+            "DESCRIBIR a0",
+        ], 85)
+        self.assertEqual(respuestas[82], {"id": 82, "ok": False, "cancelado": True})
+        self.assertTrue(respuestas[83]["ok"])
+        self.assertFalse(respuestas[84]["ok"])
+        self.assertIn("tamano_empaquetado", respuestas[85]["resultado"])
+        self.assertNotIn(("r", "optimo"), servidor_tipos.manejador._cache)
+        # La cancelación terminó el proceso de la búsqueda en lugar de dejarlo calculando
+        self.assertEqual(multiprocessing.active_children(), [])
+        self.assertLess(time.monotonic() - inicio, 10)
+
+    def test_servidor_busqueda_ve_el_esquema_al_llegar(self):
+        respuestas = self._conversar(servidor.ServidorTipos(trabajadores=1), [
+            "ATOMICO c 1 1",
+            "ATOMICO i 4 4",
+            "STRUCT s c i c",
+            "DESCRIBIR s",
+            "REDEFINIR STRUCT s i i",
+            "DESCRIBIR s SOLO tamano_empaquetado",
+            "SALIR",
+        ], 7)
+        self.assertEqual(respuestas[4]["resultado"]["tamano_empaquetado"], 6)
+        self.assertEqual(respuestas[4]["resultado"]["tamano_optimo"], 6)
+        self.assertEqual(respuestas[6]["resultado"]["tamano_empaquetado"], 8)
+
+    def test_servidor_comandos_lentos_en_hilo(self):
+        servidor_tipos = servidor.ServidorTipos(trabajadores=1)
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, "esquema.jsonl")
+            respuestas = self._conversar(servidor_tipos, [
+                "ATOMICO char 1 1",
+                "ATOMICO int 4 4",
+                "STRUCT s char int char",
+                f"EXPORTAR {ruta}",
+                "REDEFINIR STRUCT s int char",
+                "DESCRIBIR_TODO s SOLO tamano_empaquetado",
+                f"IMPORTAR {ruta}",
+            ], 7)
+        self.assertTrue(all(respuestas[i]["ok"] for i in range(1, 7)))
+        self.assertEqual(json.loads(respuestas[6]["salida"][0])["tamano_empaquetado"], 5)
+        self.assertFalse(respuestas[7]["ok"])
+
     # -----------------------------
     # Rama de error en size_alineacion: tipo desconocido en campos
     # -----------------------------
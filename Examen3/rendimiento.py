@@ -0,0 +1,271 @@
+"""Banco de pruebas de rendimiento para el manejador de tipos
+
+Genera esquemas sintéticos reproducibles (structs anchos, anidamiento profundo,
+muchas uniones y subtipos compartidos), mide tiempo, evaluaciones por segundo y
+memoria pico de las rutas críticas y guarda los resultados en JSON para poder
+comparar dos ejecuciones.
+
+Uso:
+    python rendimiento.py --salida actual.json
+    python rendimiento.py --salida nuevo.json --comparar actual.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import tipo
+from tipo import ManejadorTipos
+
+# Tipos atómicos base de todos los esquemas generados
+ATOMICOS = [("char", 1, 1), ("short", 2, 2), ("int", 4, 4), ("double", 8, 8), ("raro", 5, 3)]
+# Tamaños por defecto de cada generador
+TAMANOS = {
+    "struct_ancho": [8, 16, 24],
+    "anidado": [25, 50, 100],
+    "uniones": [100, 500, 1000],
+    "compartidos": [100, 500, 1000],
+}
+
+
+def _atomicos():
+    """Función que devuelve las definiciones de los tipos atómicos base"""
+    return [("ATOMICO", nombre, representacion, alineacion) for nombre, representacion, alineacion in ATOMICOS]
+
+
+def generar_struct_ancho(n, rng):
+    """Función que genera un único struct de n campos atómicos"""
+    campos = [rng.choice(ATOMICOS)[0] for _ in range(n)]
+    return _atomicos() + [("STRUCT", "raiz", campos)]
+
+
+def generar_anidado(n, rng):
+    """Función que genera una cadena de n structs, cada uno dentro del siguiente"""
+    definiciones = _atomicos() + [("STRUCT", "nivel0", [rng.choice(ATOMICOS)[0]])]
+    for i in range(1, n):
+        campos = [f"nivel{i - 1}", rng.choice(ATOMICOS)[0], rng.choice(ATOMICOS)[0]]
+        rng.shuffle(campos)
+        definiciones.append(("STRUCT", f"nivel{i}", campos))
+    definiciones.append(("STRUCT", "raiz", [f"nivel{n - 1}"]))
+    return definiciones
+
+
+def generar_uniones(n, rng):
+    """Función que genera n uniones que combinan atómicos y uniones anteriores"""
+    definiciones = _atomicos()
+    nombres = [nombre for nombre, _, _ in ATOMICOS]
+    for i in range(n):
+        campos = [rng.choice(nombres) for _ in range(rng.randint(2, 5))]
+        definiciones.append(("UNION", f"u{i}", campos))
+        nombres.append(f"u{i}")
+    definiciones.append(("STRUCT", "raiz", nombres[-4:]))
+    return definiciones
+
+
+def generar_compartidos(n, rng):
+    """Función que genera n registros que reutilizan unos pocos subtipos comunes"""
+    definiciones = _atomicos()
+    comunes = []
+    for i in range(4):
+        campos = [rng.choice(ATOMICOS)[0] for _ in range(rng.randint(3, 6))]
+        definiciones.append(("STRUCT", f"comun{i}", campos))
+        comunes.append(f"comun{i}")
+    for i in range(n):
+        campos = [rng.choice(comunes) for _ in range(3)] + [rng.choice(ATOMICOS)[0] for _ in range(3)]
+        definiciones.append(("STRUCT", f"registro{i}", campos))
+    definiciones.append(("STRUCT", "raiz", [f"registro{i}" for i in range(min(n, 6))]))
+    return definiciones
+
+
+GENERADORES = {
+    "struct_ancho": generar_struct_ancho,
+    "anidado": generar_anidado,
+    "uniones": generar_uniones,
+    "compartidos": generar_compartidos,
+}
+
+
+def _manejador(definiciones):
+    """Función que construye un manejador nuevo (caché vacía) con el esquema dado"""
+    manejador = ManejadorTipos()
+    errores = manejador.importar_esquema(definiciones)
+    if errores:
+        raise ValueError(f"Esquema generado inválido: {errores[0]}")
+    return manejador
+
+
+def _compuestos(definiciones):
+    """Función que devuelve los nombres de los tipos compuestos de un esquema"""
+    return [definicion[1] for definicion in definiciones if definicion[0] != "ATOMICO"]
+
+
+def caso_size_alineacion(definiciones):
+    """Caso: tamaño y alineación de todos los compuestos con la caché vacía"""
+    manejador = _manejador(definiciones)
+    compuestos = _compuestos(definiciones)
+    def ejecutar():
+        for nombre in compuestos:
+            manejador.size_alineacion(nombre, manejador.es_union(nombre))
+        return len(compuestos)
+    return ejecutar
+
+
+def caso_mejor_reordenamiento(definiciones):
+    """Caso: reordenamiento óptimo de todos los compuestos con la caché vacía"""
+    manejador = _manejador(definiciones)
+    compuestos = _compuestos(definiciones)
+    def ejecutar():
+        for nombre in compuestos:
+            manejador.mejor_reordenamiento(nombre)
+        return len(compuestos)
+    return ejecutar
+
+
+def caso_fuerza_bruta(definiciones):
+    """Caso: búsqueda exhaustiva del tipo raíz; cada permutación distinta es una evaluación"""
+    manejador = _manejador(definiciones)
+    manejador.instrumentado = True
+    def ejecutar():
+        manejador.reiniciar_estadisticas()
+        manejador.mejor_reordenamiento("raiz", metodo="fuerza_bruta")
+        return manejador.estadisticas()["permutaciones_evaluadas"]
+    return ejecutar
+
+
+def caso_describir_tipo(definiciones):
+    """Caso: descripción completa de todos los compuestos, descartando la salida"""
+    manejador = _manejador(definiciones)
+    compuestos = _compuestos(definiciones)
+    def ejecutar():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for nombre in compuestos:
+                manejador.describir_tipo(nombre)
+        return len(compuestos)
+    return ejecutar
+
+
+CASOS = {
+    "size_alineacion": caso_size_alineacion,
+    "mejor_reordenamiento": caso_mejor_reordenamiento,
+    "fuerza_bruta": caso_fuerza_bruta,
+    "describir_tipo": caso_describir_tipo,
+}
+# La búsqueda exhaustiva solo se mide donde es viable
+TAMANOS_FUERZA_BRUTA = {"struct_ancho": [6, 7, 8]}
+
+
+def medir(caso, generador, tamano, semilla=0, repeticiones=3):
+    """Función que mide un caso y devuelve un diccionario con sus resultados
+
+    El tiempo es el mejor de varias repeticiones, cada una con un manejador
+    nuevo y la memoria de rellenos vacía; la memoria pico se mide aparte con
+    tracemalloc para no distorsionar el tiempo.
+    """
+    definiciones = GENERADORES[generador](tamano, random.Random(semilla))
+    mejor = None
+    for _ in range(repeticiones):
+        ejecutar = CASOS[caso](definiciones)
+        tipo._relleno_minimo_memorizado.cache_clear()
+        inicio = time.perf_counter()
+        evaluaciones = ejecutar()
+        segundos = time.perf_counter() - inicio
+        mejor = segundos if mejor is None else min(mejor, segundos)
+
+    ejecutar = CASOS[caso](definiciones)
+    tipo._relleno_minimo_memorizado.cache_clear()
+    tracemalloc.start()
+    try:
+        ejecutar()
+        _, memoria_pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "caso": caso,
+        "generador": generador,
+        "tamano": tamano,
+        "segundos": mejor,
+        "evaluaciones": evaluaciones,
+        "evaluaciones_por_segundo": evaluaciones / mejor if mejor > 0 else None,
+        "memoria_pico": memoria_pico,
+    }
+
+
+def ejecutar_suite(casos=None, generadores=None, tamanos=None, semilla=0, repeticiones=3):
+    """Función que ejecuta todas las combinaciones de caso, generador y tamaño"""
+    resultados = []
+    for caso in casos or CASOS:
+        for generador in generadores or GENERADORES:
+            if caso == "fuerza_bruta":
+                lista = TAMANOS_FUERZA_BRUTA.get(generador, [])
+            else:
+                lista = (tamanos or TAMANOS)[generador]
+            for tamano in lista:
+                resultados.append(medir(caso, generador, tamano, semilla, repeticiones))
+    return {
+        "metadatos": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "semilla": semilla,
+            "repeticiones": repeticiones,
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "resultados": resultados,
+    }
+
+
+def comparar(base, actual, tolerancia=0.2):
+    """Función que compara dos ejecuciones y devuelve las regresiones de tiempo
+
+    Cada regresión es (caso, generador, tamaño, segundos base, segundos
+    actuales) para las mediciones que empeoraron más que la tolerancia.
+    """
+    anteriores = {(r["caso"], r["generador"], r["tamano"]): r for r in base["resultados"]}
+    regresiones = []
+    for resultado in actual["resultados"]:
+        clave = (resultado["caso"], resultado["generador"], resultado["tamano"])
+        anterior = anteriores.get(clave)
+        if anterior is not None and resultado["segundos"] > anterior["segundos"] * (1 + tolerancia):
+            regresiones.append(clave + (anterior["segundos"], resultado["segundos"]))
+    return regresiones
+
+
+def main(argv=None):
+    """Método principal del banco de pruebas"""
+    parser = argparse.ArgumentParser(description="Banco de pruebas de rendimiento del manejador de tipos")
+    parser.add_argument("--salida", help="archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="archivo JSON de una ejecución anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.2,
+                        help="empeoramiento relativo permitido antes de marcar una regresión")
+    parser.add_argument("--casos", nargs="+", choices=list(CASOS))
+    parser.add_argument("--generadores", nargs="+", choices=list(GENERADORES))
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    argumentos = parser.parse_args(argv)
+
+    actual = ejecutar_suite(argumentos.casos, argumentos.generadores,
+                            semilla=argumentos.semilla, repeticiones=argumentos.repeticiones)
+    for r in actual["resultados"]:
+        print(f"{r['caso']:>22} {r['generador']:>13} {r['tamano']:>6}: {r['segundos']:.6f} s, "
+              f"{r['evaluaciones_por_segundo'] or 0:.0f} eval/s, {r['memoria_pico']} bytes")
+    if argumentos.salida:
+        with open(argumentos.salida, "w", encoding="utf-8") as archivo:
+            json.dump(actual, archivo, indent=2)
+
+    if argumentos.comparar:
+        with open(argumentos.comparar, encoding="utf-8") as archivo:
+            base = json.load(archivo)
+        regresiones = comparar(base, actual, argumentos.tolerancia)
+        for caso, generador, tamano, antes, despues in regresiones:
+            print(f"Regresión: {caso} {generador} {tamano}: {antes:.6f} s -> {despues:.6f} s")
+        return 1 if regresiones else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,325 @@
+"""Servidor asyncio de consultas de disposición sobre un ManejadorTipos
+
+Habla el mismo protocolo de comandos que el intérprete (ATOMICO, STRUCT, UNION,
+DESCRIBIR, ...), una línea por petición, y responde una línea JSON por
+petición. Cada petición recibe un id (1, 2, 3, ... por conexión) que se incluye
+en su respuesta; las respuestas pueden llegar en otro orden porque las
+búsquedas de reordenamiento costosas se ejecutan cada una en su propio
+proceso. Con CANCELAR <id> se cancela una petición pendiente y se termina el
+proceso de su búsqueda.
+
+Uso:
+    python servidor.py --puerto 8765
+    python servidor.py --unix /tmp/tipos.sock
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from tipo import METRICAS_OPTIMAS, ManejadorTipos, TipoAtomico, argumentos_describir, ejecutar_comando
+
+# Comandos que recorren o reescriben todo el esquema, o leen y escriben archivos:
+# se ejecutan en un hilo para no bloquear el bucle de eventos
+COMANDOS_LENTOS = frozenset({"DESCRIBIR_TODO", "REDEFINIR", "IMPORTAR", "EXPORTAR"})
+
+
+def describir_estructurado(manejador, nombre, limite_tiempo=None, metricas=None):
+    """Función que devuelve la descripción de un tipo como diccionario
+
+    Solo se calculan las métricas pedidas (por defecto, todas). Se incluye
+    optimo_demostrado cuando hay límite de tiempo o cuando el óptimo no está
+    demostrado.
+    """
+    descripcion = manejador.describir(nombre, metricas, limite_tiempo)
+    resultado = {"nombre": nombre, "clase": descripcion.clase}
+    resultado.update(descripcion.como_diccionario())
+    if any(metrica in METRICAS_OPTIMAS for metrica in descripcion.metricas) and \
+            (limite_tiempo is not None or not descripcion.optimo_demostrado):
+        resultado["optimo_demostrado"] = descripcion.optimo_demostrado
+    return resultado
+
+
+def definiciones_de(manejador, nombre):
+    """Función que devuelve las definiciones del tipo y sus subtipos, en orden de dependencias
+
+    Es la instantánea que se envía a los procesos trabajadores en lugar del
+    manejador completo.
+    """
+    definiciones = []
+    visitados = set()
+    pendientes = [(nombre, False)]
+    while pendientes:
+        actual, expandido = pendientes.pop()
+        tipo = manejador.tipos[actual]
+        if expandido or isinstance(tipo, TipoAtomico):
+            if actual not in visitados:
+                visitados.add(actual)
+                if isinstance(tipo, TipoAtomico):
+                    definiciones.append(("ATOMICO", actual, tipo.representacion, tipo.alineacion))
+                else:
+                    definiciones.append(("UNION" if tipo.es_union else "STRUCT", actual, list(tipo.campos)))
+            continue
+        if actual in visitados:
+            continue
+        pendientes.append((actual, True))
+        pendientes.extend((campo, False) for campo in tipo.campos if campo not in visitados)
+    return definiciones
+
+
+def _describir_en_proceso(definiciones, nombre, limite_tiempo, metricas):
+    """Función que reconstruye el esquema en un proceso trabajador y describe el tipo"""
+    manejador = ManejadorTipos()
+    manejador.importar_esquema(definiciones)
+    return describir_estructurado(manejador, nombre, limite_tiempo, metricas)
+
+
+def _trabajar(conexion, funcion, argumentos):
+    """Función que corre en el proceso de una búsqueda y envía (éxito, resultado o excepción)"""
+    try:
+        respuesta = (True, funcion(*argumentos))
+    except Exception as error:
+        respuesta = (False, error)
+    conexion.send(respuesta)
+    conexion.close()
+
+
+def _recibir(conexion):
+    """Función que espera la respuesta del proceso de una búsqueda"""
+    try:
+        return conexion.recv()
+    except EOFError:
+        return False, RuntimeError("el proceso de la búsqueda terminó sin responder")
+
+
+def _ejecutar_capturando(manejador, partes):
+    """Función que ejecuta un comando y devuelve (sigue, líneas de salida, errores)"""
+    errores = []
+    buffer = io.StringIO()
+    manejador.reportar_error = errores.append
+    try:
+        with contextlib.redirect_stdout(buffer):
+            sigue = ejecutar_comando(manejador, partes)
+    finally:
+        del manejador.reportar_error
+    return sigue, buffer.getvalue().splitlines(), errores
+
+
+class ServidorTipos:
+    """Clase que atiende clientes concurrentes sobre un único ManejadorTipos
+
+    Los comandos baratos se ejecutan directamente en el bucle de eventos y los
+    de COMANDOS_LENTOS en un hilo; en ambos casos con el candado del manejador,
+    así que se aplican de a uno. Un DESCRIBIR de un compuesto cuyo óptimo no
+    está en caché se ejecuta en un proceso propio (como mucho trabajadores a la
+    vez) con una instantánea de sus definiciones, y su resultado se guarda en la
+    caché si el tipo no cambió mientras tanto.
+    """
+    def __init__(self, manejador=None, trabajadores=None):
+        self.manejador = manejador if manejador is not None else ManejadorTipos()
+        self.trabajadores = trabajadores or os.cpu_count() or 1
+        self._cupos = asyncio.Semaphore(self.trabajadores) # Búsquedas en ejecución a la vez
+        self._candado = asyncio.Lock() # Un solo comando a la vez sobre el manejador
+        self._hilo = ThreadPoolExecutor(max_workers=1) # Comandos lentos
+        self._procesos = set() # Procesos de las búsquedas en curso
+
+    async def iniciar(self, host="127.0.0.1", puerto=8765, ruta_unix=None):
+        """Método que abre el socket TCP (o Unix si se da ruta_unix) y devuelve el asyncio.Server"""
+        if ruta_unix is not None:
+            return await asyncio.start_unix_server(self.atender, path=ruta_unix)
+        return await asyncio.start_server(self.atender, host, puerto)
+
+    def cerrar(self):
+        """Método que termina las búsquedas en curso y detiene el hilo de los comandos lentos"""
+        for proceso in list(self._procesos):
+            proceso.terminate()
+        self._hilo.shutdown(wait=False, cancel_futures=True)
+
+    async def atender(self, lector, escritor):
+        """Método que atiende una conexión hasta SALIR o hasta que el cliente la cierre
+
+        Los comandos se aplican en el orden en que llegan; solo las búsquedas
+        enviadas a un proceso propio quedan pendientes y responden más tarde.
+        SALIR espera a las pendientes; si el cliente cierra la conexión se cancelan.
+        """
+        pendientes = {} # id -> tarea de las búsquedas aún sin responder
+        candado = asyncio.Lock() # Las respuestas se escriben de a una
+        siguiente_id = 0
+
+        async def responder(id_peticion, respuesta):
+            async with candado:
+                escritor.write(json.dumps(dict(respuesta, id=id_peticion), ensure_ascii=False).encode() + b"\n")
+                await escritor.drain()
+
+        async def resolver(id_peticion, busqueda):
+            try:
+                respuesta = await self._describir_aparte(*busqueda)
+            except asyncio.CancelledError:
+                respuesta = {"ok": False, "cancelado": True}
+            except Exception as error:
+                respuesta = {"ok": False, "errores": [f"Error: {error}"]}
+            pendientes.pop(id_peticion, None)
+            await responder(id_peticion, respuesta)
+
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                partes = linea.decode().split()
+                if not partes:
+                    continue
+                siguiente_id += 1
+                if partes[0] == "SALIR":
+                    await asyncio.gather(*pendientes.values(), return_exceptions=True)
+                    await responder(siguiente_id, {"ok": True, "salida": ["Saliendo"]})
+                    break
+                if partes[0] == "CANCELAR":
+                    await responder(siguiente_id, await self._cancelar(partes, pendientes, responder))
+                    continue
+                async with self._candado:
+                    busqueda = self._busqueda(partes)
+                    if busqueda is None:
+                        if partes[0] in COMANDOS_LENTOS:
+                            respuesta = await asyncio.get_running_loop().run_in_executor(self._hilo, self._resolver,
+                                                                                         partes)
+                        else:
+                            respuesta = self._resolver(partes)
+                if busqueda is None:
+                    await responder(siguiente_id, respuesta)
+                else:
+                    pendientes[siguiente_id] = asyncio.create_task(resolver(siguiente_id, busqueda))
+        finally:
+            for tarea in pendientes.values():
+                tarea.cancel()
+            await asyncio.gather(*pendientes.values(), return_exceptions=True)
+            escritor.close()
+
+    async def _cancelar(self, partes, pendientes, responder):
+        """Método que cancela una búsqueda pendiente; devuelve la respuesta del propio CANCELAR"""
+        id_peticion = int(partes[1]) if len(partes) == 2 and partes[1].isdigit() else None
+        tarea = pendientes.get(id_peticion)
+        if tarea is None:
+            return {"ok": False, "errores": ["Error: no hay una petición pendiente con ese id"]}
+        tarea.cancel()
+        await asyncio.gather(tarea, return_exceptions=True)
+        # Una tarea cancelada antes de empezar no llega a responder por sí misma
+        if pendientes.pop(id_peticion, None) is not None:
+            await responder(id_peticion, {"ok": False, "cancelado": True})
+        return {"ok": True, "errores": []}
+
+    def _busqueda(self, partes):
+        """Método que devuelve los datos de un DESCRIBIR costoso, o None si la petición es barata
+
+        Los datos son (nombre, límite, métricas, huella, definiciones): la
+        instantánea se toma aquí, con el candado, para que la búsqueda vea el
+        esquema tal como estaba al llegar la petición aunque los comandos
+        siguientes lo redefinan antes de que empiece.
+        """
+        manejador = self.manejador
+        if partes[0] != "DESCRIBIR":
+            return None
+        argumentos = argumentos_describir(partes)
+        if isinstance(argumentos, str) or argumentos[0] not in manejador.tipos:
+            return None
+        nombre, _, metricas = argumentos
+        # Sin métricas del óptimo no hay búsqueda que delegar
+        if metricas is not None and not any(metrica in METRICAS_OPTIMAS for metrica in metricas):
+            return None
+        if isinstance(manejador.tipos[nombre], TipoAtomico) or \
+                manejador._cache_obtener((nombre, "optimo")) is not None:
+            return None
+        return argumentos + (manejador.huella_tipo(nombre), definiciones_de(manejador, nombre))
+
+    async def _en_proceso(self, funcion, *argumentos):
+        """Método que ejecuta funcion en un proceso propio y devuelve su resultado
+
+        Si se cancela mientras espera, el proceso se termina: una búsqueda
+        cancelada no sigue ocupando un cupo ni un procesador.
+        """
+        bucle = asyncio.get_running_loop()
+        async with self._cupos:
+            receptor, emisor = multiprocessing.Pipe(duplex=False)
+            proceso = multiprocessing.Process(target=_trabajar, args=(emisor, funcion, argumentos), daemon=True)
+            proceso.start()
+            emisor.close()
+            self._procesos.add(proceso)
+            recepcion = bucle.run_in_executor(None, _recibir, receptor)
+            try:
+                exito, valor = await asyncio.shield(recepcion)
+            except asyncio.CancelledError:
+                proceso.terminate()
+                # La espera en el hilo termina sola al cerrarse el otro extremo
+                await asyncio.gather(recepcion, return_exceptions=True)
+                raise
+            finally:
+                proceso.join()
+                receptor.close()
+                self._procesos.discard(proceso)
+        if not exito:
+            raise valor
+        return valor
+
+    async def _describir_aparte(self, nombre, limite_tiempo, metricas, huella, definiciones):
+        """Método que describe un compuesto en un proceso propio a partir de la instantánea de _busqueda"""
+        manejador = self.manejador
+        resultado = await self._en_proceso(_describir_en_proceso, definiciones, nombre, limite_tiempo, None)
+        # Solo se reutiliza si el tipo no se redefinió mientras se calculaba
+        async with self._candado:
+            if limite_tiempo is None and resultado.get("optimo_demostrado", True) and nombre in manejador.tipos \
+                    and manejador.huella_tipo(nombre) == huella:
+                manejador._cache_guardar((nombre, "optimo"), (resultado["tamano_optimo"],
+                                                              resultado["alineacion_optimo"],
+                                                              resultado["desperdicio_optimo"]))
+        if metricas is not None:
+            resultado = {clave: valor for clave, valor in resultado.items()
+                         if clave in ("nombre", "clase", "optimo_demostrado") or clave in metricas}
+        return {"ok": True, "resultado": resultado}
+
+    def _resolver(self, partes):
+        """Método que produce la respuesta JSON (sin id) de una petición barata"""
+        manejador = self.manejador
+        if partes[0] == "DESCRIBIR":
+            argumentos = argumentos_describir(partes)
+            if not isinstance(argumentos, str) and argumentos[0] in manejador.tipos:
+                nombre, limite_tiempo, metricas = argumentos
+                return {"ok": True, "resultado": describir_estructurado(manejador, nombre, limite_tiempo, metricas)}
+        _, salida, errores = _ejecutar_capturando(manejador, partes)
+        return {"ok": not errores, "salida": salida, "errores": errores}
+
+
+async def _servir(argumentos):
+    """Función que arranca el servidor y atiende hasta que se interrumpa"""
+    servidor = ServidorTipos(ManejadorTipos(cache_persistente=argumentos.cache_persistente),
+                             argumentos.trabajadores)
+    try:
+        conexiones = await servidor.iniciar(argumentos.host, argumentos.puerto, argumentos.unix)
+        async with conexiones:
+            await conexiones.serve_forever()
+    finally:
+        servidor.cerrar()
+        servidor.manejador.cerrar()
+
+
+def main(argv=None):
+    """Método principal del servidor"""
+    parser = argparse.ArgumentParser(description="Servidor de consultas del manejador de tipos")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--unix", help="ruta de un socket Unix (en lugar de TCP)")
+    parser.add_argument("--trabajadores", type=int, help="búsquedas costosas en ejecución a la vez")
+    parser.add_argument("--cache-persistente", help="archivo SQLite de la caché persistente")
+    argumentos = parser.parse_args(argv)
+    try:
+        asyncio.run(_servir(argumentos))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
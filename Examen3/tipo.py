@@ -1,10 +1,697 @@
+import argparse
+import contextlib
+import csv
+import functools
+import hashlib
+import inspect
+import io
 import itertools
+import json
 import math
-import copy
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él la fuerza bruta evalúa permutación a permutación
+    np = None
+
+# Número máximo de campos para contrastar el resultado con la fuerza bruta
+LIMITE_VERIFICACION = 8
+# Permutaciones evaluadas a la vez por el evaluador vectorizado
+TAMANO_LOTE = 4096
+# Clases de tipo usadas por la tabla compacta
+CLASE_ATOMICO = 0
+CLASE_STRUCT = 1
+CLASE_UNION = 2
+# Métricas que puede devolver describir, con su texto en el intérprete
+METRICAS = {
+    "tamano_empaquetado": "Tamaño empaquetado",
+    "alineacion_empaquetado": "Alineación empaquetado",
+    "tamano_no_empaquetado": "Tamaño no empaquetado",
+    "alineacion_no_empaquetado": "Alineación no empaquetado",
+    "tamano_optimo": "Tamaño óptimo",
+    "alineacion_optimo": "Alineación óptimo",
+    "desperdicio_empaquetado": "Bytes desperdiciados (empaquetado)",
+    "desperdicio_no_empaquetado": "Bytes desperdiciados (no empaquetado)",
+    "desperdicio_optimo": "Bytes desperdiciados (óptimo)",
+}
+# Métricas que requieren buscar el mejor reordenamiento
+METRICAS_OPTIMAS = ("tamano_optimo", "alineacion_optimo", "desperdicio_optimo")
+# Secuencias de campos distintas cuyo relleno mínimo se recuerda
+TAMANO_MEMO_RELLENO = 1 << 16
+# Transiciones que prueba la programación dinámica sin plazo antes de quedarse con el orden heurístico
+LIMITE_PASOS_RELLENO = 1 << 18
+# Estados que conserva por capa la búsqueda en haz que da la cota superior del relleno
+ANCHO_HAZ_RELLENO = 32
+# Órdenes que evalúa la búsqueda local cuando solo sirve para mejorar esa cota
+LIMITE_BUSQUEDA_LOCAL = 1 << 12
+# Disposiciones de los mapas de desplazamientos, en el orden de su código en la exportación binaria
+DISPOSICIONES = ("empaquetado", "no_empaquetado", "optimo")
+# Encabezado de la exportación binaria: marca, versión, cantidad de nombres y de filas
+ENCABEZADO_DESPLAZAMIENTOS = struct.Struct("<4sHIQ")
+MARCA_DESPLAZAMIENTOS = b"DESP"
+# Columnas de la exportación binaria con su formato de struct
+COLUMNAS_DESPLAZAMIENTOS = (("tipo", "I"), ("disposicion", "B"), ("posicion", "I"), ("campo", "I"),
+                            ("desplazamiento", "q"), ("relleno", "q"))
+
+
+def _relleno_minimo(elementos, plazo=None, restantes=None, cota=None):
+    """Función que calcula el relleno mínimo de un struct por programación dinámica
+
+    Recibe una lista de pares (tamaño, alineación) y devuelve el tamaño, la
+    alineación, el relleno del mejor orden y si ese orden está demostrado
+    óptimo. El relleno de un campo solo depende de su alineación y de su
+    tamaño módulo el mcm de las alineaciones, así que los campos se agrupan
+    en clases por ese par y el tamaño real se suma aparte; el estado es la
+    cantidad de campos usados por clase. Ante empates se conserva el primer
+    orden que recorrería itertools.permutations, igual que la búsqueda por
+    fuerza bruta.
+
+    La cantidad de estados crece exponencialmente con la de clases distintas.
+    Sin plazo ni presupuesto se prueban como mucho LIMITE_PASOS_RELLENO
+    transiciones (un campo más desde un estado); si no alcanzan se devuelve el
+    orden de _cota_superior_relleno sin demostrar. Ese resultado se memoriza
+    por la secuencia exacta de campos: en los esquemas repetitivos muchos
+    structs comparten campos y orden.
+
+    Si se indica un plazo (instante de time.monotonic) o un presupuesto de
+    evaluaciones (lista de un elemento que se va descontando con las
+    transiciones probadas) y se agota, devuelve None. cota es el relleno de
+    un orden ya conocido (por ejemplo, el de una búsqueda local acotada); si
+    no se da, se calcula con _cota_superior_relleno.
+    """
+    if plazo is None and restantes is None:
+        return _relleno_minimo_memorizado(tuple(elementos))
+    exacto = _programacion_relleno(elementos, plazo, restantes, cota)
+    return None if exacto is None else exacto + (True,)
+
+
+@functools.lru_cache(maxsize=TAMANO_MEMO_RELLENO)
+def _relleno_minimo_memorizado(elementos):
+    """Función que memoriza _relleno_minimo sin plazo; el orden de elementos es parte de la clave por el desempate"""
+    mejor = _cota_superior_relleno(elementos)
+    exacto = _programacion_relleno(elementos, restantes=[LIMITE_PASOS_RELLENO], cota=mejor[2])
+    if exacto is None:
+        return mejor + (False,)
+    return exacto + (True,)
+
+
+def _clase_relleno(elemento, modulo):
+    """Función que devuelve la clase de un campo (tamaño, alineación) para la programación dinámica
+
+    El relleno solo depende de la alineación y del tamaño módulo el mcm de las
+    alineaciones; el tamaño real se suma aparte.
+    """
+    representacion, alineacion = elemento
+    return representacion % modulo, alineacion
+
+
+def _agrupar_relleno(elementos):
+    """Función que agrupa los campos (tamaño, alineación) en las clases de _clase_relleno
+
+    Devuelve el mcm de las alineaciones, las clases en orden de aparición y
+    cuántos campos hay de cada una.
+    """
+    modulo = math.lcm(*(alineacion for _, alineacion in elementos))
+    clases = {}  # (tamaño módulo el mcm, alineación) -> índice de la clase, por orden de aparición
+    for elemento in elementos:
+        clases.setdefault(_clase_relleno(elemento, modulo), len(clases))
+    cuentas = [0] * len(clases)
+    for elemento in elementos:
+        cuentas[clases[_clase_relleno(elemento, modulo)]] += 1
+    return modulo, list(clases), cuentas
+
+
+def _indices_de_clases(elementos, modulo, secuencia):
+    """Función que convierte una secuencia de índices de clase en índices de elementos
+
+    Cada clase usa sus campos en orden creciente.
+    """
+    colas = {}
+    for i, elemento in enumerate(elementos):
+        colas.setdefault(_clase_relleno(elemento, modulo), []).append(i)
+    colas = [iter(cola) for cola in colas.values()]
+    return [next(colas[indice]) for indice in secuencia]
+
+
+def _cota_superior_relleno(elementos, orden=None):
+    """Función que devuelve (tamaño, alineación, relleno) del mejor orden heurístico de los pares (tamaño, alineación)
+
+    Es el mejor entre el de _haz_relleno y, si este deja relleno, el de
+    _busqueda_local con LIMITE_BUSQUEDA_LOCAL evaluaciones (sin límite, sus
+    pasadas crecen como n^4 en structs anchos). Si orden es una lista, se le
+    agregan los índices de ese orden.
+    """
+    mejor_orden = []
+    mejor = _haz_relleno(elementos, ANCHO_HAZ_RELLENO, mejor_orden)
+    if mejor[2] > 0:
+        orden_local = []
+        local = _busqueda_local([(representacion, alineacion, 0) for representacion, alineacion in elementos],
+                                restantes=[LIMITE_BUSQUEDA_LOCAL], orden=orden_local)
+        if local[2] < mejor[2]:
+            mejor, mejor_orden = local, orden_local
+    if orden is not None:
+        orden.extend(mejor_orden)
+    return mejor
+
+
+def _haz_relleno(elementos, ancho, orden=None):
+    """Función que busca un orden de poco relleno con una búsqueda en haz
+
+    Avanza capa a capa sobre los mismos estados que _programacion_relleno,
+    pero con un solo valor por estado y conservando solo los ancho de menor
+    relleno, así que el costo es polinomial y el resultado no es
+    necesariamente óptimo. Devuelve (tamaño, alineación, relleno); si orden es
+    una lista, se le agregan los índices de elementos del orden hallado.
+    """
+    if not elementos:
+        return 0, 0, 0
+    modulo, lista_clases, cuentas = _agrupar_relleno(elementos)
+    capa = {}  # estado -> (suma de los restos usados, relleno, clase del primer campo)
+    for indice, (resto, _) in enumerate(lista_clases):
+        capa[tuple(int(i == indice) for i in range(len(lista_clases)))] = (resto, 0, indice)
+    padres = []  # Por capa, estado -> (estado anterior, clase agregada)
+    for _ in range(len(elementos) - 1):
+        nueva_capa = {}
+        padre = {}
+        for usados, (base, relleno, primera) in capa.items():
+            residuo = (base + relleno) % modulo
+            for indice, (resto, alineacion) in enumerate(lista_clases):
+                if usados[indice] == cuentas[indice]:
+                    continue
+                nuevo = relleno + (-residuo % alineacion)
+                siguiente = usados[:indice] + (usados[indice] + 1,) + usados[indice + 1:]
+                entrada = nueva_capa.get(siguiente)
+                if entrada is None or (nuevo, primera) < entrada[1:]:
+                    nueva_capa[siguiente] = (base + resto, nuevo, primera)
+                    padre[siguiente] = (usados, indice)
+        capa = dict(sorted(nueva_capa.items(), key=lambda par: par[1][1:])[:ancho])
+        padres.append(padre)
+
+    (usados, (_, relleno, primera)), = capa.items()
+    if orden is not None:
+        secuencia = []
+        for padre in reversed(padres):
+            usados, indice = padre[usados]
+            secuencia.append(indice)
+        secuencia.append(primera)
+        orden.extend(_indices_de_clases(elementos, modulo, reversed(secuencia)))
+    size = sum(representacion for representacion, _ in elementos)
+    return size + relleno, lista_clases[primera][1], relleno
+
+
+def _programacion_relleno(elementos, plazo=None, restantes=None, cota=None, orden=None):
+    """Función que implementa la programación dinámica de _relleno_minimo
+
+    Colocar un campo (redondear a su alineación y sumar su tamaño) nunca
+    adelanta el final, así que entre dos órdenes parciales que usaron los
+    mismos campos el de menos relleno termina igual o antes. Por eso el estado
+    es solo la cantidad de campos usados por clase y se guardan los valores
+    (relleno, clase del primer campo) que no están dominados en ambas cosas;
+    el desplazamiento módulo el mcm se deduce de los restos usados y del
+    relleno.
+
+    Si el orden heurístico ya alcanza _cota_inferior_relleno (siempre que no
+    deja relleno), el mínimo es conocido y solo se busca con _camino_relleno
+    la primera clase que puede empezar un orden con ese relleno.
+
+    El plazo y el presupuesto se comprueban en cada estado expandido, no solo
+    por capa: una capa puede tener millones de estados. Si orden es una
+    lista, se le agregan los índices de clase del orden hallado.
+    """
+    if not elementos:
+        return 0, 0, 0
+    modulo, lista_clases, cuentas = _agrupar_relleno(elementos)
+
+    # Cota superior: relleno del mejor orden heurístico. Los estados que
+    # ya la superan no pueden llevar al óptimo y se descartan
+    if cota is None:
+        cota = _cota_superior_relleno(elementos)[2]
+    size = sum(representacion for representacion, _ in elementos)
+    niveles = _niveles_relleno(lista_clases)
+    if _cota_inferior_relleno(niveles, cuentas, [0] * len(lista_clases), 0) == cota:
+        for primera in range(len(lista_clases)):
+            camino = _camino_relleno(lista_clases, cuentas, modulo, niveles, primera, cota, plazo, restantes)
+            if camino is None:
+                return None
+            if camino:
+                if orden is not None:
+                    orden.extend(camino)
+                return size + cota, lista_clases[primera][1], cota
+
+    # Primer campo: siempre empieza en el desplazamiento 0, sin relleno. Cada
+    # estado guarda la suma de los restos usados y sus valores no dominados
+    capa = {}
+    for indice, (resto, _) in enumerate(lista_clases):
+        usados = tuple(int(i == indice) for i in range(len(lista_clases)))
+        capa[usados] = (resto, [(0, indice)])
+    padres = [] if orden is not None else None
+    if padres is not None:
+        padres.append({(usados, valores[0]): (None, valores[0][1]) for usados, (_, valores) in capa.items()})
+
+    pasos = 0  # Transiciones consideradas: es lo que se descuenta del presupuesto
+    revision = 0
+    for _ in range(len(elementos) - 1):
+        nueva_capa = {}
+        if padres is not None:
+            padre = {}
+            padres.append(padre)
+        for usados, (base, valores) in capa.items():
+            pasos += len(valores) * len(lista_clases)
+            if restantes is not None:
+                restantes[0] -= len(valores) * len(lista_clases)
+                if restantes[0] < 0:
+                    return None
+            if plazo is not None and pasos - revision >= 4096:
+                revision = pasos
+                if time.monotonic() > plazo:
+                    return None
+            for valor_anterior in valores:
+                relleno, primera = valor_anterior
+                residuo = (base + relleno) % modulo
+                for indice, (resto, alineacion) in enumerate(lista_clases):
+                    if usados[indice] == cuentas[indice]:
+                        continue
+                    nuevo = relleno + (-residuo % alineacion)
+                    if nuevo > cota:
+                        continue
+                    siguiente = usados[:indice] + (usados[indice] + 1,) + usados[indice + 1:]
+                    valor = (nuevo, primera)
+                    entrada = nueva_capa.get(siguiente)
+                    if entrada is None:
+                        nueva_capa[siguiente] = (base + resto, [valor])
+                    elif not _agregar_no_dominado(entrada[1], valor):
+                        continue
+                    if padres is not None:
+                        padre[(siguiente, valor)] = ((usados, valor_anterior), indice)
+        capa = nueva_capa
+
+    (usados, (_, valores)), = capa.items()
+    relleno, primera = min(valores)
+    if padres is not None:
+        clave = (usados, (relleno, primera))
+        secuencia = []
+        for padre in reversed(padres):
+            clave, indice = padre[clave]
+            secuencia.append(indice)
+        orden.extend(reversed(secuencia))
+    return size + relleno, lista_clases[primera][1], relleno
+
+
+def _agregar_no_dominado(valores, valor):
+    """Función que agrega valor (relleno, clase) si ningún otro de valores es menor o igual en ambos
+
+    Descarta los valores que el nuevo domina. Devuelve True si se agregó.
+    """
+    relleno, primera = valor
+    for otro_relleno, otra_primera in valores:
+        if otro_relleno <= relleno and otra_primera <= primera:
+            return False
+    valores[:] = [otro for otro in valores if not (relleno <= otro[0] and primera <= otro[1])]
+    valores.append(valor)
+    return True
+
+
+def _niveles_relleno(clases):
+    """Función que prepara, por cada alineación mayor que 1, los datos que usa _cota_inferior_relleno
+
+    Devuelve tuplas (alineación, por clase el relleno que pide después un campo
+    que debe empezar en un múltiplo de ella, o None para los demás, y las
+    clases de los demás cuyo tamaño no es múltiplo).
+    """
+    niveles = []
+    for nivel in sorted({alineacion for _, alineacion in clases if alineacion > 1}):
+        huecos = [-resto % nivel if alineacion % nivel == 0 else None for resto, alineacion in clases]
+        correctores = [i for i, (resto, alineacion) in enumerate(clases)
+                       if alineacion % nivel and resto % nivel]
+        niveles.append((nivel, huecos, correctores))
+    return niveles
+
+
+def _cota_inferior_relleno(niveles, cuentas, usados, residuo):
+    """Función que acota por debajo el relleno que aún falta agregar
+
+    En cada nivel de alineación, entre un campo alineado y el siguiente (o
+    entre el desplazamiento actual y el primero) el relleno completa el resto
+    hasta un múltiplo, salvo que en medio vaya algún campo de tamaño no
+    múltiplo. Cada uno de esos correctores arregla a lo sumo un hueco, y el
+    último alineado no deja hueco, así que se descartan los más caros.
+    """
+    cota = 0
+    for nivel, huecos, correctores in niveles:
+        pendientes = [0] * nivel
+        for hueco, cuenta, usado in zip(huecos, cuentas, usados):
+            if hueco is not None:
+                pendientes[hueco] += cuenta - usado
+        if not any(pendientes):
+            continue
+        pendientes[max(hueco for hueco, cuenta in enumerate(pendientes) if cuenta)] -= 1
+        pendientes[-residuo % nivel] += 1
+        descartar = sum(cuentas[i] - usados[i] for i in correctores)
+        total = 0
+        for hueco in range(nivel - 1, 0, -1):
+            cuenta = pendientes[hueco]
+            if descartar >= cuenta:
+                descartar -= cuenta
+            else:
+                total += (cuenta - descartar) * hueco
+                descartar = 0
+        cota = max(cota, total)
+    return cota
+
+
+def _camino_relleno(clases, cuentas, modulo, niveles, primera, cota, plazo=None, restantes=None):
+    """Función que busca un orden de clases que empiece por primera y no pase de cota bytes de relleno
+
+    Es una búsqueda en profundidad con pila explícita que poda con
+    _cota_inferior_relleno y recuerda el menor relleno con que ya fracasó cada
+    estado. Devuelve la lista de índices de clase, False si no hay tal orden o
+    None si se agotó el plazo o el presupuesto.
+    """
+    total = sum(cuentas)
+    usados = [0] * len(clases)
+    pesos = [0] * len(clases)  # El estado se codifica en base mixta para recordarlo
+    peso = 1
+    for indice, cuenta in enumerate(cuentas):
+        pesos[indice] = peso
+        peso *= cuenta + 1
+    fracasos = {}  # estado -> menor relleno con que se expandió sin éxito
+    camino = []
+    # Cada marco es (relleno, estado, candidatos (hueco, clase) por probar, siguiente candidato)
+    pila = [(0, 0, [(0, primera)], 0)]
+    expandidos = 0
+    while pila:
+        relleno, estado, candidatos, siguiente = pila[-1]
+        if siguiente == len(candidatos) or relleno + candidatos[siguiente][0] > cota:
+            # Sin más candidatos: se marca el fracaso y se deshace el campo que llevó aquí
+            pila.pop()
+            fracasos[estado] = relleno
+            if camino:
+                usados[camino.pop()] -= 1
+            continue
+        pila[-1] = (relleno, estado, candidatos, siguiente + 1)
+        hueco, indice = candidatos[siguiente]
+        nuevo = relleno + hueco
+        usados[indice] += 1
+        camino.append(indice)
+        if len(camino) == total:
+            return camino
+        nuevo_estado = estado + pesos[indice]
+        residuo = (sum(usado * clase[0] for usado, clase in zip(usados, clases)) + nuevo) % modulo
+        if fracasos.get(nuevo_estado, cota + 1) <= nuevo or \
+                nuevo + _cota_inferior_relleno(niveles, cuentas, usados, residuo) > cota:
+            usados[camino.pop()] -= 1
+            continue
+        expandidos += 1
+        if restantes is not None:
+            restantes[0] -= len(clases)
+            if restantes[0] < 0:
+                return None
+        if plazo is not None and expandidos % 256 == 0 and time.monotonic() > plazo:
+            return None
+        # Primero los campos que piden menos relleno
+        candidatos = sorted((-residuo % alineacion, i) for i, (_, alineacion) in enumerate(clases)
+                            if usados[i] < cuentas[i])
+        pila.append((nuevo, nuevo_estado, candidatos, 0))
+    return False
+
+
+@functools.lru_cache(maxsize=TAMANO_MEMO_RELLENO)
+def _orden_relleno_minimo(elementos):
+    """Función que devuelve los índices de elementos (pares (tamaño, alineación)) en un orden de relleno mínimo
+
+    El orden tiene el tamaño, la alineación y el relleno de _relleno_minimo
+    (empieza por la misma clase), aunque no es necesariamente el primero que
+    recorrería la fuerza bruta. Si la programación dinámica supera
+    LIMITE_PASOS_RELLENO, es el orden de _cota_superior_relleno.
+    """
+    if not elementos:
+        return ()
+    orden_heuristico = []
+    mejor = _cota_superior_relleno(elementos, orden_heuristico)
+    secuencia = []
+    if _programacion_relleno(elementos, restantes=[LIMITE_PASOS_RELLENO], cota=mejor[2], orden=secuencia) is None:
+        return tuple(orden_heuristico)
+    modulo = math.lcm(*(alineacion for _, alineacion in elementos))
+    return tuple(_indices_de_clases(elementos, modulo, secuencia))
+
+
+def _evaluar_elementos(elementos, orden, es_union):
+    """Función que evalúa un orden de campos ya resueltos a (tamaño, alineación, bytes desperdiciados)
+
+    Devuelve (tamaño no empaquetado, alineación, bytes desperdiciados) con la
+    misma aritmética que evaluar_orden cuando se piden los campos óptimos.
+    """
+    if es_union:
+        return (max((elementos[i][0] for i in orden), default=0),
+                math.lcm(*(elementos[i][1] for i in orden)),
+                sum(elementos[i][2] for i in orden))
+    desplazamiento = 0
+    bits = 0
+    for i in orden:
+        size, alineacion, bits_campo = elementos[i]
+        hueco = -desplazamiento % alineacion
+        desplazamiento += hueco + size
+        bits += hueco + bits_campo
+    return desplazamiento, (elementos[orden[0]][1] if orden else 0), bits
+
+
+def _mejor_orden(elementos, es_union, demostrado=None):
+    """Función que devuelve (tamaño, alineación, bytes desperdiciados) del mejor orden de campos ya resueltos
+
+    Si demostrado es una lista de un elemento, se pone en False cuando el
+    orden de un struct sale de _cota_superior_relleno sin demostrar.
+    """
+    bits_anidados = sum(bits for _, _, bits in elementos)
+    if es_union:
+        # En las uniones el orden no influye: tamaño del mayor y mcm de las alineaciones
+        return (max((size for size, _, _ in elementos), default=0),
+                math.lcm(*(alineacion for _, alineacion, _ in elementos)),
+                bits_anidados)
+    size, alineacion, relleno, es_optimo = _relleno_minimo([(size, alineacion) for size, alineacion, _ in elementos])
+    if demostrado is not None and not es_optimo:
+        demostrado[0] = False
+    return size, alineacion, relleno + bits_anidados
+
+
+def _busqueda_local(elementos, plazo=None, restantes=None, orden=None):
+    """Función que mejora un orden de struct intercambiando pares de campos
+
+    Parte del orden por alineación descendente y aplica el primer intercambio
+    que reduzca el tamaño hasta llegar a un mínimo local o agotar el plazo o
+    el presupuesto de evaluaciones. Devuelve (tamaño, alineación, bytes
+    desperdiciados) del mejor orden encontrado; si orden es una lista, se le
+    agregan los índices de ese orden.
+    """
+    actual = sorted(range(len(elementos)), key=lambda i: (-elementos[i][1], -elementos[i][0]))
+    mejor = _evaluar_elementos(elementos, actual, False)
+    mejora = True
+    while mejora and mejor[0] > sum(e[0] for e in elementos):
+        mejora = False
+        for i, j in itertools.combinations(range(len(actual)), 2):
+            if elementos[actual[i]][:2] == elementos[actual[j]][:2]:
+                continue  # Intercambiar campos equivalentes no cambia nada
+            if (plazo is not None and time.monotonic() > plazo) or (restantes is not None and restantes[0] <= 0):
+                mejora = False
+                break
+            if restantes is not None:
+                restantes[0] -= 1
+            actual[i], actual[j] = actual[j], actual[i]
+            resultado = _evaluar_elementos(elementos, actual, False)
+            if resultado[0] < mejor[0]:
+                mejor = resultado
+                mejora = True
+                break
+            actual[i], actual[j] = actual[j], actual[i]
+    if orden is not None:
+        orden.extend(actual)
+    return mejor
+
+
+def _adaptar_evaluador(funcion_evaluadora):
+    """Función que adapta a (campos, es_union, optimo) un evaluador de mejor_reordenamiento
+
+    Antes los evaluadores recibían (tipo_nombre, es_union, optimo) con los
+    campos del tipo ya permutados. size_alineacion de un manejador da lo mismo
+    que su evaluar_orden con los campos permutados, así que se cambia por
+    este; otro evaluador cuyo primer parámetro es tipo_nombre no se puede
+    adaptar sin modificar la tabla de tipos y lanza TypeError.
+    """
+    if getattr(funcion_evaluadora, "__func__", None) is ManejadorTipos.size_alineacion:
+        return funcion_evaluadora.__self__.evaluar_orden
+    try:
+        parametros = list(inspect.signature(funcion_evaluadora).parameters)
+    except (TypeError, ValueError):
+        return funcion_evaluadora
+    if parametros[:1] == ["tipo_nombre"]:
+        raise TypeError("funcion_evaluadora debe recibir (campos, es_union, optimo); "
+                        "el contrato (tipo_nombre, es_union, optimo) ya no se admite")
+    return funcion_evaluadora
+
+
+def permutaciones_distintas(clases, prefijo=(), largo=None):
+    """Función que recorre solo las permutaciones de campos que dan órdenes distintos
+
+    clases[i] es la clase de equivalencia del campo i (dos campos de la misma
+    clase son intercambiables). Produce tuplas de índices de largo campos (por
+    defecto, todos) que empiezan por prefijo. De cada grupo de permutaciones
+    equivalentes se produce solo la primera que daría itertools.permutations
+    (la que usa los campos de cada clase en orden creciente), en el mismo orden
+    relativo, así que quedarse con el primer mínimo da el mismo resultado que
+    recorrerlas todas.
+    """
+    n = len(clases)
+    largo = n if largo is None else largo
+    prefijo = tuple(prefijo)
+    if len(set(clases)) == n:
+        # Sin campos repetidos todas las permutaciones son distintas
+        restantes = [i for i in range(n) if i not in prefijo]
+        return (prefijo + resto for resto in itertools.permutations(restantes, largo - len(prefijo)))
+    return _permutaciones_multiconjunto(clases, prefijo, largo)
+
+
+def _permutaciones_multiconjunto(clases, prefijo, largo):
+    """Generador de permutaciones_distintas cuando hay campos repetidos"""
+    colas = {} # clase -> índices de sus campos, en orden creciente
+    for i, clase in enumerate(clases):
+        colas.setdefault(clase, []).append(i)
+    colas = list(colas.values())
+    clase_de = {i: k for k, cola in enumerate(colas) for i in cola}
+    usados = [0] * len(colas) # Campos de cada clase ya colocados
+    for i in prefijo:
+        usados[clase_de[i]] += 1
+    orden = list(prefijo)
+
+    def extender():
+        if len(orden) == largo:
+            yield tuple(orden)
+            return
+        # Candidatos: el primer campo libre de cada clase, en orden de índice
+        candidatos = sorted((cola[usados[k]], k) for k, cola in enumerate(colas) if usados[k] < len(cola))
+        for i, k in candidatos:
+            usados[k] += 1
+            orden.append(i)
+            yield from extender()
+            orden.pop()
+            usados[k] -= 1
+
+    yield from extender()
+
+
+def _contar_permutaciones(clases):
+    """Función que devuelve cuántas permutaciones distintas produce permutaciones_distintas"""
+    total = math.factorial(len(clases))
+    for cuenta in Counter(clases).values():
+        total //= math.factorial(cuenta)
+    return total
+
+
+def _buscar_en_fragmento(elementos, es_union, prefijo):
+    """Función que recorre las permutaciones que empiezan por prefijo (se ejecuta en otro proceso)"""
+    mejor = None
+    for orden in permutaciones_distintas(elementos, prefijo):
+        resultado = _evaluar_elementos(elementos, orden, es_union)
+        if mejor is None or resultado[0] < mejor[0]:
+            mejor = resultado
+    return mejor
+
+
+def evaluar_lote(tamanos, alineaciones, bits, ordenes, es_union=False):
+    """Función que evalúa con NumPy muchos órdenes de campos a la vez
+
+    tamanos, alineaciones y bits son arreglos con los valores de cada campo y
+    ordenes es un arreglo 2-D con una permutación (índices de campo) por fila.
+    Devuelve tres arreglos: tamaño no empaquetado, alineación y bytes
+    desperdiciados de cada fila.
+    """
+    if es_union:
+        return (tamanos[ordenes].max(axis=1),
+                np.lcm.reduce(alineaciones[ordenes], axis=1),
+                bits[ordenes].sum(axis=1))
+    filas, columnas = ordenes.shape
+    desplazamiento = np.zeros(filas, dtype=np.int64)
+    relleno = np.zeros(filas, dtype=np.int64)
+    # Se avanza columna a columna; cada paso procesa todas las filas juntas
+    for j in range(columnas):
+        alineacion = alineaciones[ordenes[:, j]]
+        hueco = -desplazamiento % alineacion
+        desplazamiento += hueco + tamanos[ordenes[:, j]]
+        relleno += hueco
+    alineacion = alineaciones[ordenes[:, 0]] if columnas else np.zeros(filas, dtype=np.int64)
+    return desplazamiento, alineacion, relleno + bits[ordenes].sum(axis=1)
+
+
+def lotes_de_permutaciones(clases, tamano_lote):
+    """Función que produce las permutaciones de permutaciones_distintas como arreglos 2-D de NumPy
+
+    Cada arreglo tiene a lo sumo tamano_lote filas (una permutación por fila),
+    en el mismo orden que permutaciones_distintas. Solo se recorren en Python
+    los prefijos: el sufijo se completa con un bloque precalculado de las
+    permutaciones distintas de sus posiciones, uno por cada patrón de campos
+    repetidos, aplicado a los campos que quedan libres tras cada prefijo.
+    """
+    n = len(clases)
+    # Largo del sufijo: el mayor cuyo bloque cabe en un lote aun sin campos repetidos
+    largo_sufijo = 0
+    while largo_sufijo < n and math.factorial(largo_sufijo + 1) <= tamano_lote:
+        largo_sufijo += 1
+    largo_prefijo = n - largo_sufijo
+
+    def patron(prefijo):
+        # Clase de cada campo libre (en orden de índice), numeradas por aparición
+        if len(set(clases)) == n:
+            return tuple(range(largo_sufijo))
+        usados = set(prefijo)
+        numeros = {}
+        return tuple(numeros.setdefault(clases[i], len(numeros)) for i in range(n) if i not in usados)
+
+    bloques = {}  # patrón -> permutaciones distintas de las posiciones del sufijo
+    pendientes = []
+    filas = 0
+    for clave, grupo in itertools.groupby(permutaciones_distintas(clases, largo=largo_prefijo), key=patron):
+        bloque = bloques.get(clave)
+        if bloque is None:
+            sufijos = list(permutaciones_distintas(clave))
+            bloque = np.array(sufijos, dtype=np.intp).reshape(len(sufijos), largo_sufijo)
+            bloques[clave] = bloque
+        por_trozo = max(1, tamano_lote // len(bloque))
+        while True:
+            prefijos = np.array(list(itertools.islice(grupo, por_trozo)), dtype=np.intp)
+            if not len(prefijos):
+                break
+            prefijos = prefijos.reshape(len(prefijos), largo_prefijo)
+            # Índices de los campos libres de cada prefijo, en orden creciente
+            libres = np.ones((len(prefijos), n), dtype=bool)
+            libres[np.arange(len(prefijos))[:, None], prefijos] = False
+            libres = np.nonzero(libres)[1].reshape(len(prefijos), largo_sufijo)
+            ordenes = np.empty((len(prefijos), len(bloque), n), dtype=np.intp)
+            ordenes[:, :, :largo_prefijo] = prefijos[:, None, :]
+            ordenes[:, :, largo_prefijo:] = libres[:, bloque]
+            ordenes = ordenes.reshape(len(prefijos) * len(bloque), n)
+            if pendientes and filas + len(ordenes) > tamano_lote:
+                yield np.concatenate(pendientes)
+                pendientes = []
+                filas = 0
+            pendientes.append(ordenes)
+            filas += len(ordenes)
+    if pendientes:
+        yield np.concatenate(pendientes)
+
 
 # Definición de las clases de tipos de datos
 class TipoAtomico:
     """Clase que implementa los tipos atómicos"""
+    __slots__ = ("nombre", "representacion", "alineacion")
+
     def __init__(self, nombre, representacion, alineacion):
         self.nombre = nombre
         self.representacion = representacion
@@ -12,6 +699,8 @@ class TipoAtomico:
 
 class TipoCompuesto:
     """Clase que implementa los registros y los registro variantes"""
+    __slots__ = ("nombre", "campos", "es_union")
+
     def __init__(self, nombre, campos,es_union=False):
         self.nombre = nombre
         self.campos = campos
@@ -23,16 +712,441 @@ class MiClase:
         self.campos = campos
 
 
+class TablaTipos(Mapping):
+    """Clase que implementa una tabla de tipos compacta para esquemas muy grandes
+
+    Cada nombre se interna a un entero. Los tamaños y alineaciones atómicos se
+    guardan en arreglos paralelos y los campos de los compuestos, como ids, en
+    un único arreglo plano. Se consulta por nombre como un diccionario; los
+    TipoAtomico/TipoCompuesto que devuelve son copias construidas al vuelo.
+    """
+    def __init__(self):
+        self.ids = {} # nombre -> id
+        self.nombres = [] # id -> nombre
+        self.clases = bytearray() # id -> CLASE_ATOMICO, CLASE_STRUCT o CLASE_UNION
+        self.representaciones = array("q") # id -> representación (0 en compuestos)
+        self.alineaciones = array("q") # id -> alineación (0 en compuestos)
+        self.inicios = array("q") # id -> posición de sus campos en campos_planos
+        self.largos = array("q") # id -> cantidad de campos
+        self.campos_planos = array("q") # ids de los campos de todos los compuestos
+
+    def _guardar(self, nombre, clase, representacion, alineacion, inicio, largo):
+        """Método que reserva (o reutiliza) el id de un nombre y guarda sus datos"""
+        if nombre in self.ids:
+            i = self.ids[nombre]
+            self.clases[i] = clase
+            self.representaciones[i] = representacion
+            self.alineaciones[i] = alineacion
+            self.inicios[i] = inicio
+            self.largos[i] = largo
+            return i
+        nombre = sys.intern(nombre)
+        self.ids[nombre] = len(self.nombres)
+        self.nombres.append(nombre)
+        self.clases.append(clase)
+        self.representaciones.append(representacion)
+        self.alineaciones.append(alineacion)
+        self.inicios.append(inicio)
+        self.largos.append(largo)
+        return self.ids[nombre]
+
+    def agregar_atomico(self, nombre, representacion, alineacion):
+        """Método que guarda un tipo atómico y devuelve su id"""
+        return self._guardar(nombre, CLASE_ATOMICO, representacion, alineacion, 0, 0)
+
+    def agregar_compuesto(self, nombre, campos, es_union=False):
+        """Método que guarda un registro o registro variante y devuelve su id"""
+        inicio = len(self.campos_planos)
+        self.campos_planos.extend(self.ids[campo] for campo in campos)
+        return self._guardar(nombre, CLASE_UNION if es_union else CLASE_STRUCT, 0, 0, inicio, len(campos))
+
+    def campos_ids(self, i):
+        """Método que devuelve los ids de los campos del compuesto con id i"""
+        if self.clases[i] == CLASE_ATOMICO:
+            raise TypeError(f"El tipo '{self.nombres[i]}' es atómico y no tiene campos")
+        inicio = self.inicios[i]
+        return self.campos_planos[inicio:inicio + self.largos[i]]
+
+    def __setitem__(self, nombre, tipo):
+        if isinstance(tipo, TipoAtomico):
+            self.agregar_atomico(nombre, tipo.representacion, tipo.alineacion)
+        elif isinstance(tipo, TipoCompuesto):
+            self.agregar_compuesto(nombre, tipo.campos, tipo.es_union)
+        else:
+            raise TypeError(f"Tipo no reconocido: {tipo}")
+
+    def __getitem__(self, nombre):
+        i = self.ids[nombre]
+        if self.clases[i] == CLASE_ATOMICO:
+            return TipoAtomico(self.nombres[i], self.representaciones[i], self.alineaciones[i])
+        return TipoCompuesto(self.nombres[i], [self.nombres[j] for j in self.campos_ids(i)],
+                             self.clases[i] == CLASE_UNION)
+
+    def __contains__(self, nombre):
+        return nombre in self.ids
+
+    def __iter__(self):
+        return iter(self.nombres)
+
+    def __len__(self):
+        return len(self.nombres)
+
+
+class CachePersistente:
+    """Clase que guarda resultados de disposición en un archivo SQLite
+
+    Los resultados se indexan por la huella de contenido del tipo (ver
+    ManejadorTipos.huella_tipo) y el modo, así que sirven entre procesos
+    mientras la definición transitiva del tipo no cambie. Las escrituras se
+    confirman cada `lote` inserciones y al cerrar.
+    """
+    def __init__(self, ruta, lote=1000):
+        self.lote = lote
+        self._pendientes = 0
+        self._candado = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._conexion.execute("CREATE TABLE IF NOT EXISTS disposiciones ("
+                               "huella TEXT NOT NULL, modo TEXT NOT NULL, resultado TEXT NOT NULL, "
+                               "PRIMARY KEY (huella, modo))")
+
+    def obtener(self, huella, modo):
+        """Método que devuelve el resultado guardado o None"""
+        with self._candado:
+            fila = self._conexion.execute("SELECT resultado FROM disposiciones WHERE huella = ? AND modo = ?",
+                                          (huella, modo)).fetchone()
+        return None if fila is None else tuple(json.loads(fila[0]))
+
+    def guardar(self, huella, modo, resultado):
+        """Método que guarda (o reemplaza) un resultado"""
+        with self._candado:
+            self._conexion.execute("INSERT OR REPLACE INTO disposiciones VALUES (?, ?, ?)",
+                                   (huella, modo, json.dumps(resultado)))
+            self._pendientes += 1
+            if self._pendientes >= self.lote:
+                self._conexion.commit()
+                self._pendientes = 0
+
+    def confirmar(self):
+        """Método que escribe en disco las inserciones pendientes"""
+        with self._candado:
+            self._conexion.commit()
+            self._pendientes = 0
+
+    def cerrar(self):
+        """Método que confirma lo pendiente y cierra el archivo"""
+        self.confirmar()
+        self._conexion.close()
+
+
+class Descripcion:
+    """Clase con la descripción de un tipo; cada métrica se calcula al leerla por primera vez
+
+    Las métricas del orden original salen de una sola llamada a
+    size_alineacion y las del orden óptimo de una a mejor_reordenamiento, que
+    solo se hace si se lee alguna de ellas. Leer una métrica que no está en
+    metricas lanza AttributeError.
+    """
+    __slots__ = ("nombre", "clase", "metricas", "optimo_demostrado", "_manejador", "_limite_tiempo") + tuple(METRICAS)
+
+    def __init__(self, manejador, nombre, metricas=None, limite_tiempo=None):
+        self._manejador = manejador
+        self._limite_tiempo = limite_tiempo
+        self.nombre = nombre
+        clase = manejador._clasificar(nombre)[1]
+        self.clase = "ATOMICO" if clase == CLASE_ATOMICO else "UNION" if clase == CLASE_UNION else "STRUCT"
+        self.metricas = tuple(METRICAS) if metricas is None else tuple(metricas)
+
+    def __getattr__(self, metrica):
+        # Solo se llama cuando la ranura todavía no tiene valor
+        if metrica not in METRICAS and metrica != "optimo_demostrado":
+            raise AttributeError(metrica)
+        if metrica in METRICAS and metrica not in self.metricas:
+            raise AttributeError(f"la métrica '{metrica}' no se pidió")
+        self._calcular(metrica in METRICAS_OPTIMAS or metrica == "optimo_demostrado")
+        return object.__getattribute__(self, metrica)
+
+    def _calcular(self, optimo):
+        """Método que calcula y guarda las métricas del orden original o del óptimo"""
+        manejador = self._manejador
+        _, clase, representacion, alineacion = manejador._clasificar(self.nombre)
+        if clase == CLASE_ATOMICO:
+            valores = {"tamano": representacion, "alineacion": alineacion, "desperdicio": 0}
+            for metrica in METRICAS:
+                setattr(self, metrica, valores[metrica.split("_")[0]])
+            self.optimo_demostrado = True
+        elif optimo:
+            if self._limite_tiempo is None:
+                size, alineacion, bits = manejador.mejor_reordenamiento(self.nombre)
+                self.optimo_demostrado = self.nombre not in manejador._no_demostrados
+            else:
+                size, alineacion, bits, self.optimo_demostrado = manejador.mejor_reordenamiento(
+                    self.nombre, metodo="acotado", limite_tiempo=self._limite_tiempo)
+            self.tamano_optimo, self.alineacion_optimo, self.desperdicio_optimo = size, alineacion, bits
+        else:
+            (self.tamano_empaquetado, self.tamano_no_empaquetado, self.alineacion_empaquetado,
+             self.alineacion_no_empaquetado, self.desperdicio_no_empaquetado) = \
+                manejador.size_alineacion(self.nombre, clase == CLASE_UNION)
+            self.desperdicio_empaquetado = 0
+
+    def como_diccionario(self):
+        """Método que devuelve las métricas pedidas (calculándolas) como diccionario"""
+        return {metrica: getattr(self, metrica) for metrica in self.metricas}
+
+    def __repr__(self):
+        # Solo se muestran las métricas ya calculadas, para no disparar la búsqueda
+        calculadas = []
+        for metrica in self.metricas:
+            try:
+                calculadas.append(f"{metrica}={object.__getattribute__(self, metrica)}")
+            except AttributeError:
+                pass
+        return f"Descripcion({self.nombre!r}, {self.clase}{''.join(', ' + c for c in calculadas)})"
+
+
 class ManejadorTipos:
     """Clase que implementa el manejador de tipos de datos"""
-    def __init__(self):
-        self.tipos = {} # Diccionario para los tipos
+    def __init__(self, limite_cache=None, compacto=False, instrumentado=False, cache_persistente=None):
+        self._compacto = compacto # Con compacto=True los tipos se guardan en una TablaTipos
+        self.tipos = TablaTipos() if compacto else {} # Diccionario para los tipos
+        self.limite_cache = limite_cache # Máximo de entradas en la caché (None: sin límite)
+        self._cache = OrderedDict() # (nombre, modo) -> resultado, en orden de uso (LRU)
+        self._dependientes = {} # nombre -> tipos compuestos que lo usan como campo (en modo compacto, id -> ids)
+        self._inverso = None # Modo compacto: (inicios, dependientes) por id, armado en la primera invalidación
+        self._no_demostrados = set() # Compuestos cuyo óptimo es heurístico, sin demostrar
+        self._candado = threading.RLock() # Protege la caché entre hilos
+        self.instrumentado = instrumentado # Con False los contadores no se tocan
+        self._observadores = [] # Funciones (evento, datos) avisadas con instrumentación activa
+        self._local = threading.local() # Profundidad de recursión de cada hilo
+        # Caché en disco opcional (ruta de un archivo SQLite) y huellas ya calculadas
+        self._persistente = CachePersistente(cache_persistente) if cache_persistente else None
+        self._huellas = {}
+        self.reiniciar_estadisticas()
+
+
+    def cerrar(self):
+        """Método que guarda y cierra la caché persistente, si la hay"""
+        if self._persistente is not None:
+            self._persistente.cerrar()
+            self._persistente = None
+
+
+    def reiniciar_estadisticas(self):
+        """Método que pone en cero los contadores de instrumentación"""
+        self._estadisticas = {
+            "llamadas_size_alineacion": 0,
+            "profundidad_maxima": 0,
+            "llamadas_mejor_reordenamiento": 0,
+            "permutaciones_evaluadas": 0,
+            "aciertos_cache": 0,
+            "fallos_cache": 0,
+            "aciertos_cache_persistente": 0,
+            "comandos": {}, # comando -> [veces, segundos totales, segundos máximos]
+        }
+
+
+    def estadisticas(self):
+        """Método que devuelve una copia de los contadores de instrumentación"""
+        copia = dict(self._estadisticas)
+        copia["comandos"] = {comando: {"veces": veces, "segundos": total, "maximo": maximo}
+                             for comando, (veces, total, maximo) in self._estadisticas["comandos"].items()}
+        return copia
+
+
+    def agregar_observador(self, funcion):
+        """Método que registra una función funcion(evento, datos) para perfilar
+
+        Se avisa con los eventos "mejor_reordenamiento" y "comando", con los
+        segundos que tardaron, solo mientras la instrumentación está activa.
+        """
+        self._observadores.append(funcion)
+
+
+    def _avisar(self, evento, datos):
+        """Método que avisa un evento a los observadores"""
+        for funcion in self._observadores:
+            funcion(evento, datos)
+
+
+    def registrar_comando(self, comando, segundos):
+        """Método que acumula la latencia de un comando del intérprete"""
+        veces, total, maximo = self._estadisticas["comandos"].get(comando, (0, 0.0, 0.0))
+        self._estadisticas["comandos"][comando] = [veces + 1, total + segundos, max(maximo, segundos)]
+        self._avisar("comando", {"comando": comando, "segundos": segundos})
+
+
+    def _cache_obtener(self, clave):
+        """Método que busca un resultado en la caché y lo marca como recién usado"""
+        with self._candado:
+            resultado = self._cache.get(clave)
+            if resultado is not None:
+                self._cache.move_to_end(clave)
+            if self.instrumentado:
+                self._estadisticas["aciertos_cache" if resultado is not None else "fallos_cache"] += 1
+        # Si no está en memoria se busca en disco por la huella del tipo
+        if resultado is None and self._persistente is not None:
+            resultado = self._persistente.obtener(self.huella_tipo(clave[0]), clave[1])
+            if resultado is not None:
+                if self.instrumentado:
+                    self._estadisticas["aciertos_cache_persistente"] += 1
+                if clave[1] == "optimo":
+                    self._no_demostrados.discard(clave[0])  # En disco solo se guardan óptimos demostrados
+                self._cache_guardar(clave, resultado, persistir=False)
+        return resultado
+
+
+    def _cache_guardar(self, clave, resultado, persistir=True):
+        """Método que guarda un resultado en la caché respetando el límite de entradas"""
+        if persistir and self._persistente is not None:
+            self._persistente.guardar(self.huella_tipo(clave[0]), clave[1], resultado)
+        if self.limite_cache == 0:
+            return
+        with self._candado:
+            self._cache[clave] = resultado
+            self._cache.move_to_end(clave)
+            if self.limite_cache is not None:
+                while len(self._cache) > self.limite_cache:
+                    self._cache.popitem(last=False)
+
+
+    def _contenedores(self, nombre):
+        """Método que devuelve el tipo y todos los tipos que lo contienen, directa o indirectamente"""
+        if self._compacto:
+            return self._contenedores_compacto(nombre)
+        pendientes = [nombre]
+        visitados = {nombre}
+        while pendientes:
+            actual = pendientes.pop()
+            for dependiente in self._dependientes.get(actual, ()):
+                if dependiente not in visitados:
+                    visitados.add(dependiente)
+                    pendientes.append(dependiente)
+        return visitados
+
+
+    def _contenedores_compacto(self, nombre):
+        """Método que implementa _contenedores sobre el índice inverso de la TablaTipos
+
+        El índice se arma la primera vez que se necesita y los compuestos
+        agregados o redefinidos después se anotan aparte en _dependientes. Las
+        aristas de definiciones ya reemplazadas no se borran: se descartan al
+        recorrerlas, comprobando que el campo siga en el dependiente.
+        """
+        tabla = self.tipos
+        if self._inverso is None:
+            self._armar_inverso()
+        inicios, dependientes = self._inverso
+        inicial = tabla.ids[nombre]
+        pendientes = [inicial]
+        visitados = {inicial}
+        while pendientes:
+            actual = pendientes.pop()
+            candidatos = list(self._dependientes.get(actual, ()))
+            if actual + 1 < len(inicios):
+                candidatos.extend(dependientes[inicios[actual]:inicios[actual + 1]])
+            for dependiente in candidatos:
+                if dependiente not in visitados and tabla.clases[dependiente] != CLASE_ATOMICO \
+                        and actual in tabla.campos_ids(dependiente):
+                    visitados.add(dependiente)
+                    pendientes.append(dependiente)
+        return {tabla.nombres[i] for i in visitados}
+
+
+    def _armar_inverso(self):
+        """Método que arma el índice inverso de la TablaTipos como dos arreglos de ids
+
+        Los compuestos que usan el tipo con id i son
+        dependientes[inicios[i]:inicios[i + 1]] (un ordenamiento por conteo
+        sobre campos_planos), sin un conjunto por tipo.
+        """
+        tabla = self.tipos
+        cantidad = len(tabla.nombres)
+        inicios = array("q", bytes(8 * (cantidad + 1)))
+        for i in range(cantidad):
+            if tabla.clases[i] != CLASE_ATOMICO:
+                for campo in tabla.campos_ids(i):
+                    inicios[campo + 1] += 1
+        for i in range(cantidad):
+            inicios[i + 1] += inicios[i]
+        posiciones = array("q", inicios)
+        dependientes = array("q", bytes(8 * inicios[cantidad]))
+        for i in range(cantidad):
+            if tabla.clases[i] != CLASE_ATOMICO:
+                for campo in tabla.campos_ids(i):
+                    dependientes[posiciones[campo]] = i
+                    posiciones[campo] += 1
+        self._inverso = (inicios, dependientes)
+        self._dependientes.clear()
+
+
+    def _registrar_dependiente(self, nombre, campos):
+        """Método que anota el compuesto nombre como dependiente de cada uno de sus campos
+
+        En modo compacto no se anota nada mientras el índice inverso no exista,
+        porque al armarlo ya incluye la definición actual.
+        """
+        if not self._compacto:
+            for campo in campos:
+                self._dependientes.setdefault(campo, set()).add(nombre)
+        elif self._inverso is not None:
+            tabla = self.tipos
+            for campo in campos:
+                campo = campo if isinstance(campo, int) else tabla.ids[campo]
+                self._dependientes.setdefault(campo, set()).add(tabla.ids[nombre])
+
+
+    def invalidar_tipo(self, nombre):
+        """Método que descarta de la caché un tipo y todos los tipos que lo contienen
+
+        Devuelve las claves (nombre, modo) que estaban en la caché.
+        """
+        descartadas = []
+        with self._candado:
+            for actual in self._contenedores(nombre):
+                self._huellas.pop(actual, None)
+                self._no_demostrados.discard(actual)
+                for modo in ("original", "anidado_optimo", "optimo"):
+                    if self._cache.pop((actual, modo), None) is not None:
+                        descartadas.append((actual, modo))
+        return descartadas
+
+    
+    def huella_tipo(self, nombre):
+        """Método que devuelve un hash de la definición transitiva de un tipo
+
+        Solo depende de tamaños, alineaciones, clase y orden de los campos (no
+        de los nombres), así que dos tipos con la misma estructura comparten
+        huella y un cambio en cualquier subtipo cambia la huella.
+        """
+        nombre = self._clasificar(nombre)[0]
+        # Recorrido en postorden con pila explícita: cada hijo antes que su contenedor
+        pendientes = [(nombre, False)]
+        while pendientes:
+            actual, expandido = pendientes.pop()
+            if actual in self._huellas:
+                continue
+            _, clase, representacion, alineacion = self._clasificar(actual)
+            if clase == CLASE_ATOMICO:
+                texto = f"A {representacion} {alineacion}"
+            else:
+                hijos = [self._clasificar(campo)[0] for campo in self._campos_de(actual)[0]]
+                if not expandido:
+                    pendientes.append((actual, True))
+                    pendientes.extend((hijo, False) for hijo in hijos)
+                    continue
+                texto = ("U " if clase == CLASE_UNION else "S ") + " ".join(self._huellas[hijo] for hijo in hijos)
+            self._huellas[actual] = hashlib.sha256(texto.encode()).hexdigest()
+        return self._huellas[nombre]
+
+
+    def reportar_error(self, mensaje):
+        """Método que informa un error; el modo por lotes lo reemplaza para numerar las líneas"""
+        print(mensaje)
 
     
     def agregar_tipo_atomico(self, nombre, representacion, alineacion):
         """Método que define un nuevo tipo atómico"""
         if nombre in self.tipos:
-            print(f"Error: el tipo '{nombre}' ya existe.")
+            self.reportar_error(f"Error: el tipo '{nombre}' ya existe.")
             return
         self.tipos[nombre] = TipoAtomico(nombre, representacion, alineacion)
 
@@ -40,19 +1154,352 @@ class ManejadorTipos:
     def agregar_tipo_compuesto(self, nombre, tipos_campos, es_union=False):
         """Método que define un nuevo registro o un nuevo registro variante"""
         if nombre in self.tipos:
-            print(f"Error: el tipo '{nombre}' ya existe.")
+            self.reportar_error(f"Error: el tipo '{nombre}' ya existe.")
             return
         for tipo in tipos_campos:
             if tipo not in self.tipos:
-                print(f"Error: el tipo '{tipo}' no está definido.")
+                self.reportar_error(f"Error: el tipo '{tipo}' no está definido.")
                 return
         self.tipos[nombre] = TipoCompuesto(nombre, tipos_campos, es_union)
+        self._registrar_dependiente(nombre, tipos_campos)
+
+
+    def redefinir_tipo_atomico(self, nombre, representacion, alineacion):
+        """Método que cambia la definición de un tipo existente por un tipo atómico"""
+        if nombre not in self.tipos:
+            self.reportar_error(f"Error: el tipo '{nombre}' no está definido.")
+            return
+        self._reemplazar_tipo(nombre, TipoAtomico(nombre, representacion, alineacion))
+
+
+    def redefinir_tipo_compuesto(self, nombre, tipos_campos, es_union=False):
+        """Método que cambia la definición de un tipo existente por un registro o registro variante
+
+        Se rechaza si alguno de los campos contiene (directa o indirectamente)
+        al propio tipo, porque la definición sería cíclica.
+        """
+        if nombre not in self.tipos:
+            self.reportar_error(f"Error: el tipo '{nombre}' no está definido.")
+            return
+        for tipo in tipos_campos:
+            if tipo not in self.tipos:
+                self.reportar_error(f"Error: el tipo '{tipo}' no está definido.")
+                return
+        contenedores = self._contenedores(nombre)
+        for tipo in tipos_campos:
+            if tipo in contenedores:
+                self.reportar_error(f"Error: redefinir '{nombre}' con el campo '{tipo}' crearía un ciclo.")
+                return
+        self._reemplazar_tipo(nombre, TipoCompuesto(nombre, list(tipos_campos), es_union))
+
+
+    def _reemplazar_tipo(self, nombre, tipo_nuevo):
+        """Método que sustituye un tipo y recalcula solo los tipos afectados
+
+        Se actualiza el grafo de dependencias, se descartan de la caché el tipo
+        y los que lo contienen, y se vuelven a calcular los resultados que
+        estaban guardados para ellos.
+        """
+        # En modo compacto las aristas viejas se descartan al recorrerlas
+        if not self._compacto and self._clasificar(nombre)[1] != CLASE_ATOMICO:
+            for campo in self._campos_de(nombre)[0]:
+                self._dependientes.get(campo, set()).discard(nombre)
+        self.tipos[nombre] = tipo_nuevo
+        if isinstance(tipo_nuevo, TipoCompuesto):
+            self._registrar_dependiente(nombre, tipo_nuevo.campos)
+
+        for actual, modo in self.invalidar_tipo(nombre):
+            if self._clasificar(actual)[1] == CLASE_ATOMICO:
+                continue
+            if modo == "optimo":
+                self.mejor_reordenamiento(actual)
+            else:
+                self.size_alineacion(actual, self.es_union(actual), modo == "anidado_optimo")
+
+
+    def importar_esquema(self, definiciones):
+        """Método que define muchos tipos de una vez, en cualquier orden
+
+        Cada definición es ("ATOMICO", nombre, representacion, alineacion),
+        ("STRUCT", nombre, campos) o ("UNION", nombre, campos). Las referencias
+        hacia adelante se resuelven con un único ordenamiento topológico y se
+        detectan duplicados, tipos no definidos y ciclos. Si hay algún error no
+        se agrega ningún tipo. Devuelve la lista de errores (vacía si todo se
+        importó).
+        """
+        nuevos = {} # nombre -> definición
+        errores = []
+        for definicion in definiciones:
+            nombre = definicion[1]
+            if nombre in self.tipos or nombre in nuevos:
+                errores.append(f"Error: el tipo '{nombre}' ya existe.")
+                continue
+            nuevos[nombre] = definicion
+
+        # Se cuenta cuántos campos de cada compuesto están en el mismo esquema
+        pendientes = {} # nombre -> campos nuevos aún no ordenados
+        usuarios = {} # campo nuevo -> compuestos nuevos que lo usan
+        for nombre, definicion in nuevos.items():
+            if definicion[0] == "ATOMICO":
+                continue
+            pendientes[nombre] = 0
+            for campo in set(definicion[2]):
+                if campo in nuevos:
+                    pendientes[nombre] += 1
+                    usuarios.setdefault(campo, []).append(nombre)
+                elif campo not in self.tipos:
+                    errores.append(f"Error: el tipo '{campo}' no está definido.")
+
+        # Ordenamiento topológico (Kahn): cada tipo se agrega después de sus campos
+        orden = [nombre for nombre in nuevos if pendientes.get(nombre, 0) == 0]
+        for actual in orden:
+            for usuario in usuarios.get(actual, ()):
+                pendientes[usuario] -= 1
+                if pendientes[usuario] == 0:
+                    orden.append(usuario)
+        if len(orden) < len(nuevos):
+            ciclo = [nombre for nombre, faltan in pendientes.items() if faltan > 0]
+            errores.append(f"Error: dependencias cíclicas, no se pueden ordenar los tipos: {', '.join(ciclo)}")
+        if errores:
+            return errores
+
+        for nombre in orden:
+            definicion = nuevos[nombre]
+            if definicion[0] == "ATOMICO":
+                self.tipos[nombre] = TipoAtomico(nombre, definicion[2], definicion[3])
+            else:
+                campos = list(definicion[2])
+                self.tipos[nombre] = TipoCompuesto(nombre, campos, definicion[0] == "UNION")
+                if not self._compacto:
+                    self._registrar_dependiente(nombre, campos)
+        # En modo compacto el índice inverso se vuelve a armar en la próxima invalidación
+        self._inverso = None
+        return errores
+
+
+    def cargar_esquema(self, ruta):
+        """Método que importa un esquema desde un archivo .json, .jsonl o de comandos
+
+        Devuelve la lista de errores, igual que importar_esquema.
+        """
+        try:
+            with open(ruta, encoding="utf-8") as archivo:
+                if ruta.endswith(".json"):
+                    definiciones = [_definicion_desde_json(objeto) for objeto in json.load(archivo)]
+                elif ruta.endswith(".jsonl"):
+                    definiciones = [_definicion_desde_json(json.loads(linea)) for linea in archivo if linea.strip()]
+                else:
+                    definiciones = list(leer_esquema_comandos(archivo))
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            return [f"Error: no se pudo leer el esquema '{ruta}': {error}"]
+        return self.importar_esquema(definiciones)
+
+
+    def exportar_desplazamientos(self, ruta, nombres=None):
+        """Método que escribe los mapas de desplazamientos de muchos compuestos en un archivo
+
+        Con ruta .csv se escribe una fila por campo y disposición, a medida que
+        se calculan (tipo, disposicion, posicion, campo, desplazamiento,
+        relleno). Con otra extensión se escribe el formato binario por columnas
+        que lee leer_desplazamientos: el encabezado, la tabla de nombres y cada
+        columna como un arreglo little-endian. Por defecto se exportan todos los
+        compuestos. Devuelve la cantidad de filas.
+        """
+        if nombres is None:
+            nombres = [nombre for nombre in self.tipos if self._clasificar(nombre)[1] != CLASE_ATOMICO]
+        filas = ((nombre, disposicion, posicion, campo, desplazamiento, relleno)
+                 for nombre in nombres
+                 for disposicion, mapa in self.desplazamientos(nombre).items()
+                 for posicion, campo, desplazamiento, relleno in mapa)
+        total = 0
+        if ruta.endswith(".csv"):
+            with open(ruta, "w", encoding="utf-8", newline="") as archivo:
+                escritor = csv.writer(archivo)
+                escritor.writerow([columna for columna, _ in COLUMNAS_DESPLAZAMIENTOS])
+                for fila in filas:
+                    escritor.writerow(fila)
+                    total += 1
+            return total
+
+        indices = {} # nombre -> posición en la tabla de nombres
+        columnas = [array("q") for _ in COLUMNAS_DESPLAZAMIENTOS]
+        codigos = {disposicion: i for i, disposicion in enumerate(DISPOSICIONES)}
+        for nombre, disposicion, posicion, campo, desplazamiento, relleno in filas:
+            valores = (indices.setdefault(nombre, len(indices)), codigos[disposicion], posicion,
+                       indices.setdefault(campo, len(indices)), desplazamiento, relleno)
+            for columna, valor in zip(columnas, valores):
+                columna.append(valor)
+            total += 1
+        with open(ruta, "wb") as archivo:
+            archivo.write(ENCABEZADO_DESPLAZAMIENTOS.pack(MARCA_DESPLAZAMIENTOS, 1, len(indices), total))
+            for nombre in indices:
+                codificado = nombre.encode("utf-8")
+                archivo.write(struct.pack("<H", len(codificado)) + codificado)
+            for columna, (_, formato) in zip(columnas, COLUMNAS_DESPLAZAMIENTOS):
+                archivo.write(struct.pack(f"<{total}{formato}", *columna))
+        return total
+
+
+    def _clasificar(self, campo):
+        """Método que devuelve (nombre, clase, representación, alineación) de un campo dado por nombre o id
+
+        Los ids solo existen en el modo compacto. En los compuestos la
+        representación y la alineación valen 0.
+        """
+        if self._compacto:
+            tabla = self.tipos
+            i = campo if isinstance(campo, int) else tabla.ids[campo]
+            return tabla.nombres[i], tabla.clases[i], tabla.representaciones[i], tabla.alineaciones[i]
+        campo_dato = self.tipos[campo]
+        if isinstance(campo_dato, TipoAtomico):
+            return campo, CLASE_ATOMICO, campo_dato.representacion, campo_dato.alineacion
+        if isinstance(campo_dato, TipoCompuesto):
+            return campo, CLASE_UNION if campo_dato.es_union else CLASE_STRUCT, 0, 0
+        raise TypeError(f"Tipo no reconocido: {campo}")
+
+
+    def _campos_de(self, tipo_nombre):
+        """Método que devuelve (campos, es_union) de un tipo compuesto; en modo compacto, los campos son ids"""
+        if self._compacto:
+            i = self.tipos.ids[tipo_nombre]
+            return self.tipos.campos_ids(i), self.tipos.clases[i] == CLASE_UNION
+        tipo = self.tipos[tipo_nombre] # Se obtiene el tipo de dato del diccionario de tipos
+        return tipo.campos, tipo.es_union
 
 
     def size_alineacion(self, tipo_nombre, es_union=False, optimo=False):
         """Método que calcula el tamaño y la alineación de un tipo"""
+        if not self.instrumentado:
+            return self._size_alineacion(tipo_nombre, es_union, optimo)
+        self._estadisticas["llamadas_size_alineacion"] += 1
+        profundidad = getattr(self._local, "profundidad", 0) + 1
+        self._local.profundidad = profundidad
+        if profundidad > self._estadisticas["profundidad_maxima"]:
+            self._estadisticas["profundidad_maxima"] = profundidad
+        try:
+            return self._size_alineacion(tipo_nombre, es_union, optimo)
+        finally:
+            self._local.profundidad = profundidad - 1
+
+
+    def _size_alineacion(self, tipo_nombre, es_union=False, optimo=False):
+        """Método que calcula el tamaño y la alineación de un tipo usando la caché"""
+        campos, es_union_tipo = self._campos_de(tipo_nombre)
+        # Solo se guarda en caché la llamada con la clase real del tipo
+        if es_union != es_union_tipo:
+            return self.evaluar_orden(campos, es_union, optimo)
+        return self._evaluar_abajo_arriba(tipo_nombre, "anidado_optimo" if optimo else "original")
+
+
+    def _evaluar_abajo_arriba(self, tipo_nombre, modo):
+        """Método que calcula un compuesto en el modo dado sin recursión de Python
+
+        Primero se resuelven, de las hojas a la raíz, los subtipos que faltan
+        en la caché ("original" y "optimo" necesitan el mismo modo en los
+        hijos; "anidado_optimo" necesita el "optimo" de los hijos) y después el
+        propio tipo. Cada compuesto se calcula una sola vez por modo, así que el
+        costo es lineal en el total de campos y la profundidad no tiene límite.
+        """
+        if modo != "anidado_optimo":
+            resueltos = {}
+            self._resolver_pendientes(tipo_nombre, modo, resueltos)
+            return resueltos[tipo_nombre]
+        clave = (tipo_nombre, modo)
+        resultado = self._cache_obtener(clave)
+        if resultado is None:
+            campos, es_union = self._campos_de(tipo_nombre)
+            resueltos = {}
+            for campo in campos:
+                nombre, clase, _, _ = self._clasificar(campo)
+                if clase != CLASE_ATOMICO:
+                    self._resolver_pendientes(nombre, "optimo", resueltos)
+            resultado = self._evaluar_orden(campos, es_union, True, resueltos)
+            self._cache_guardar(clave, resultado, persistir=self._no_demostrados.isdisjoint(resueltos))
+        return resultado
+
+
+    def _compuestos_en_postorden(self, tipo_nombre, modo=None, resueltos=None):
+        """Método que devuelve el compuesto y sus subtipos compuestos de las hojas a la raíz
+
+        Usa una pila explícita, así que la profundidad no tiene límite. Si se
+        da modo, los que ya están en la caché en ese modo se copian a resueltos
+        y no se recorre su interior.
+        """
+        orden = []
+        visitados = set()
+        pendientes = [(tipo_nombre, False)]
+        while pendientes:
+            actual, expandido = pendientes.pop()
+            if expandido:
+                orden.append(actual)
+                continue
+            if actual in visitados or (resueltos is not None and actual in resueltos):
+                continue
+            if modo is not None:
+                resultado = self._cache_obtener((actual, modo))
+                if resultado is not None:
+                    resueltos[actual] = resultado
+                    continue
+            visitados.add(actual)
+            pendientes.append((actual, True))
+            for campo in self._campos_de(actual)[0]:
+                nombre, clase, _, _ = self._clasificar(campo)
+                if clase != CLASE_ATOMICO:
+                    pendientes.append((nombre, False))
+        return orden
+
+
+    def _resolver_pendientes(self, tipo_nombre, modo, resueltos):
+        """Método que agrega a resueltos el resultado en modo ("original" u "optimo") del tipo y sus subtipos
+
+        Los que ya están en la caché se copian y no se recorre su interior; el
+        resto se calcula en postorden a partir de los resultados de sus campos.
+        Un óptimo que no quedó demostrado (propio o de algún campo) se anota en
+        _no_demostrados y no se guarda en la caché persistente.
+        """
+        for actual in self._compuestos_en_postorden(tipo_nombre, modo, resueltos):
+            campos, es_union = self._campos_de(actual)
+            demostrado = [True]
+            if modo == "original":
+                resultado = self._evaluar_orden(campos, es_union, False, resueltos)
+            else:
+                elementos = []
+                for campo in campos:
+                    nombre, clase, representacion, alineacion = self._clasificar(campo)
+                    if clase == CLASE_ATOMICO:
+                        elementos.append((representacion, alineacion, 0))
+                    else:
+                        elementos.append(resueltos[nombre])
+                        if nombre in self._no_demostrados:
+                            demostrado[0] = False
+                resultado = _mejor_orden(elementos, es_union, demostrado)
+                if demostrado[0]:
+                    self._no_demostrados.discard(actual)
+                else:
+                    self._no_demostrados.add(actual)
+            resueltos[actual] = resultado
+            self._cache_guardar((actual, modo), resultado, persistir=demostrado[0])
+
+
+    def evaluar_orden(self, campos, es_union=False, optimo=False, registro=None):
+        """Método que calcula tamaño y alineación de un registro con los campos en el orden dado
+
+        Los campos se dan por nombre o, en modo compacto, también por id. No
+        modifica la tabla de tipos, así que puede usarse desde varios hilos a la vez.
+        Si registro es una lista, se le agrega por campo (desplazamiento
+        empaquetado, desplazamiento no empaquetado, relleno previo).
+        """
+        return self._evaluar_orden(campos, es_union, optimo, registro=registro)
+
+
+    def _evaluar_orden(self, campos, es_union=False, optimo=False, resueltos=None, registro=None):
+        """Método que implementa evaluar_orden
 
-        tipo = self.tipos[tipo_nombre] # Se obtiene el tipo de dato del diccionario de tipos  
+        resueltos es un diccionario opcional nombre -> resultado de los campos
+        compuestos ya calculados (del modo "optimo" si optimo, si no del
+        "original"); los que no están se piden a mejor_reordenamiento o a
+        size_alineacion.
+        """
         size_empaquetado = 0  # Tamaño del tipo cuando los campos están empaquetados
         size_no_empaquetado = 0  # Tamaño del tipo cuando los campos no están empaquetados
         union_emp = 0  # Tamaño de la unión empaquetada
@@ -67,12 +1514,11 @@ class ManejadorTipos:
        
 
         # Para cada campo del tipo compuesto
-        for campo in tipo.campos:
-            # Se obtiene los detalles del campo desde el diccionario de tipos
-            campo_dato = self.tipos[campo]
-            if isinstance(campo_dato, TipoAtomico):  # Si el campo es un tipo atómico
-                representacion = campo_dato.representacion
-                alineacion = campo_dato.alineacion
+        for campo in campos:
+            inicio = alineacion_Actual # Desplazamiento antes del relleno del campo
+            # Se obtiene los detalles del campo desde la tabla de tipos
+            nombre, clase, representacion, alineacion = self._clasificar(campo)
+            if clase == CLASE_ATOMICO:  # Si el campo es un tipo atómico
                 # Se establece la alineación del primer campo
                 if PrimeraAlineacion:
                     alineacion_empaquetado = alineacion
@@ -90,18 +1536,24 @@ class ManejadorTipos:
                     alineacion_Actual += (alineacion - (alineacion_Actual % alineacion)) + representacion
                     
                 
-            elif isinstance(campo_dato, TipoCompuesto):  # Si el campo es un tipo compuesto (struct o union)
+            else:  # Si el campo es un tipo compuesto (struct o union)
                 # Se hace la llamada recursiva para calcular tamaño y alineación del tipo compuesto  
                 existeCompuesto = True
                 # Para cuando se busca el mejor reordenamiento
                 if optimo:
-                    representacion_no_empaquetada, ali_empaquetado, bits =self.mejor_reordenamiento(campo_dato.nombre, self.size_alineacion)
+                    if resueltos is not None and nombre in resueltos:
+                        representacion_no_empaquetada, ali_empaquetado, bits = resueltos[nombre]
+                    else:
+                        representacion_no_empaquetada, ali_empaquetado, bits =self.mejor_reordenamiento(nombre)
                     representacion= representacion_no_empaquetada
                     alineacion = ali_empaquetado
                     bit_desperdiciados += bits
                 # Calculo recursivo para averiguar el tamaño y alineación
                 else:
-                    representacion, representacion_no_empaquetada, ali_empaquetado, _, bits =self.size_alineacion(campo_dato.nombre, self.es_union(campo_dato.nombre))
+                    if resueltos is not None and nombre in resueltos:
+                        representacion, representacion_no_empaquetada, ali_empaquetado, _, bits = resueltos[nombre]
+                    else:
+                        representacion, representacion_no_empaquetada, ali_empaquetado, _, bits =self.size_alineacion(nombre, clase == CLASE_UNION)
                     alineacion = ali_empaquetado
                     bit_desperdiciados += bits
                 # Se establece la alineación del primer campo compuesto
@@ -119,16 +1571,12 @@ class ManejadorTipos:
                     if not es_union:
                         bit_desperdiciados += (ali_empaquetado - (alineacion_Actual % ali_empaquetado))
                     alineacion_Actual += (ali_empaquetado - (alineacion_Actual % ali_empaquetado)) + representacion_no_empaquetada
-                    
-
-            else:
-                raise TypeError(f"Tipo no reconocido: {campo}")
 
             
 
             if es_union:
              # Para uniones, el tamaño es el del campo más grande
-                if isinstance(campo_dato, TipoAtomico):
+                if clase == CLASE_ATOMICO:
                     representacion_no_empaquetada = representacion
                 union_emp = max(union_emp, representacion)
                 union_no_emp= max(union_no_emp, representacion_no_empaquetada)
@@ -137,6 +1585,15 @@ class ManejadorTipos:
                     bit_desperdiciados =0
                 
             
+            # Desplazamientos del campo en las dos disposiciones (en las uniones, todos en 0)
+            if registro is not None:
+                if es_union:
+                    registro.append((0, 0, 0))
+                else:
+                    desplazamiento = alineacion_Actual - (representacion if clase == CLASE_ATOMICO
+                                                          else representacion_no_empaquetada)
+                    registro.append((size_empaquetado, desplazamiento, desplazamiento - inicio))
+
             # Para estructuras, se suman los tamaños de representación y no empaquetados
             size_empaquetado += representacion
     
@@ -154,43 +1611,395 @@ class ManejadorTipos:
 
 
 
-    def mejor_reordenamiento(self, tipo_nombre, funcion_evaluadora):
-        tipo_original = self.tipos[tipo_nombre]
-        resultados = []
+    def mejor_reordenamiento(self, tipo_nombre, funcion_evaluadora=None, metodo="dinamico", verificar=False,
+                             trabajadores=None, limite_tiempo=None, limite_evaluaciones=None):
+        """Método que busca el orden de campos con menor tamaño no empaquetado
+
+        Con metodo="dinamico" se usa la programación dinámica sobre clases de
+        alineación. Sus estados crecen exponencialmente con el número de clases
+        distintas (tamaño módulo el mcm de las alineaciones, alineación), así
+        que prueba a lo sumo LIMITE_PASOS_RELLENO transiciones por struct; si
+        no alcanzan, se queda con el mejor orden de _cota_superior_relleno (una
+        búsqueda en haz y una búsqueda local acotada) y el struct queda sin
+        demostrar: no se guarda en la caché persistente y su Descripcion tiene
+        optimo_demostrado en False. Con metodo="fuerza_bruta" se recorren todas las permutaciones
+        evaluándolas con funcion_evaluadora(campos, es_union, optimo); si no se
+        indica, se evalúan por lotes con NumPy o, sin NumPy, con evaluar_orden.
+        El contrato anterior (tipo_nombre, es_union, optimo) solo se acepta para
+        size_alineacion, que se cambia por evaluar_orden; con otro evaluador así
+        se lanza TypeError.
+        Con verificar=True se contrasta el resultado dinámico con la fuerza
+        bruta cuando hay pocos campos. Con metodo="paralelo" se hace la misma
+        búsqueda exhaustiva repartida entre trabajadores procesos (por defecto,
+        uno por núcleo). Con metodo="acotado" se respeta limite_tiempo
+        (segundos) y/o limite_evaluaciones y se devuelve además una bandera que
+        indica si el resultado está demostrado como óptimo.
+        """
+        argumentos = (tipo_nombre, funcion_evaluadora, metodo, verificar, trabajadores,
+                      limite_tiempo, limite_evaluaciones)
+        if not self.instrumentado:
+            return self._mejor_reordenamiento(*argumentos)
+        self._estadisticas["llamadas_mejor_reordenamiento"] += 1
+        inicio = time.perf_counter()
+        resultado = self._mejor_reordenamiento(*argumentos)
+        self._avisar("mejor_reordenamiento", {"nombre": tipo_nombre, "metodo": metodo,
+                                              "segundos": time.perf_counter() - inicio})
+        return resultado
+
+
+    def _mejor_reordenamiento(self, tipo_nombre, funcion_evaluadora, metodo, verificar, trabajadores,
+                              limite_tiempo, limite_evaluaciones):
+        """Método que despacha la búsqueda del mejor reordenamiento según el método"""
+        if metodo == "dinamico":
+            return self._reordenamiento_dinamico(tipo_nombre, verificar)
+        if metodo == "paralelo":
+            return self._reordenamiento_paralelo(tipo_nombre, trabajadores)
+        if metodo == "acotado":
+            plazo = None if limite_tiempo is None else time.monotonic() + limite_tiempo
+            restantes = None if limite_evaluaciones is None else [limite_evaluaciones]
+            return self._reordenamiento_acotado(tipo_nombre, plazo, restantes)
+        if metodo != "fuerza_bruta":
+            raise ValueError(f"Método de reordenamiento desconocido: {metodo}")
+        campos, es_union = self._campos_de(tipo_nombre)
+        if funcion_evaluadora is None:
+            if np is not None and campos:
+                return self._reordenamiento_por_lotes(tipo_nombre)
+            funcion_evaluadora = self.evaluar_orden
+            # Con el evaluador propio los campos con el mismo resultado óptimo son intercambiables
+            clases = [self._elemento_optimo(campo) for campo in campos]
+        else:
+            funcion_evaluadora = _adaptar_evaluador(funcion_evaluadora)
+            # Con otro evaluador solo se sabe que un mismo tipo repetido da lo mismo
+            clases = list(campos)
+
+        mejor = None
+
+        # Cada permutación se evalúa sin copiar el tipo ni tocar el diccionario de tipos
+        for orden in permutaciones_distintas(clases):
+            resultado = funcion_evaluadora(tuple(campos[i] for i in orden), es_union, True)
+
+            # Se conserva la primera permutación con el menor size_no_empaquetado
+            if mejor is None or resultado[1] < mejor[1]:
+                mejor = resultado
+
+        if self.instrumentado:
+            self._estadisticas["permutaciones_evaluadas"] += _contar_permutaciones(clases)
+
+        return mejor[1], mejor[3], mejor[4]
+
 
-        # Guardar copia del orden original
-        campos_originales = tipo_original.campos[:]
+    def _reordenamiento_por_lotes(self, tipo_nombre):
+        """Método que recorre las permutaciones distintas en lotes de hasta TAMANO_LOTE evaluados con NumPy"""
+        campos, es_union = self._campos_de(tipo_nombre)
+        elementos = [self._elemento_optimo(campo) for campo in campos]
+        tamanos = np.array([size for size, _, _ in elementos], dtype=np.int64)
+        alineaciones = np.array([alineacion for _, alineacion, _ in elementos], dtype=np.int64)
+        bits_campos = np.array([bits for _, _, bits in elementos], dtype=np.int64)
 
-        for perm in itertools.permutations(campos_originales):
-            # Crear una copia del tipo compuesto con los campos reordenados
-            tipo_copia = copy.deepcopy(tipo_original)
-            tipo_copia.campos = list(perm)
+        mejor = None
+        for ordenes in lotes_de_permutaciones(elementos, TAMANO_LOTE):
+            sizes, alineaciones_lote, bits_lote = evaluar_lote(tamanos, alineaciones, bits_campos, ordenes, es_union)
+            # argmin devuelve la primera fila mínima, igual que el recorrido secuencial
+            i = int(np.argmin(sizes))
+            if mejor is None or sizes[i] < mejor[0]:
+                mejor = (int(sizes[i]), int(alineaciones_lote[i]), int(bits_lote[i]))
+        if self.instrumentado:
+            self._estadisticas["permutaciones_evaluadas"] += _contar_permutaciones(elementos)
+        return mejor
 
-            # Evaluar con la función externa usando el nombre del tipo copia
-            self.tipos[tipo_nombre] = tipo_copia
-            resultado = funcion_evaluadora(tipo_nombre, self.es_union(tipo_nombre), True)
 
-            size_no_empaquetado = resultado[1]
-            alineacion_no_empaquetado = resultado[3]
-            bit = resultado[4]
+    def _reordenamiento_paralelo(self, tipo_nombre, trabajadores=None):
+        """Método que reparte la búsqueda exhaustiva entre varios procesos
 
-            resultados.append((size_no_empaquetado, alineacion_no_empaquetado, bit))
+        El espacio de permutaciones se divide fijando los primeros campos. Cada
+        proceso recibe solo los campos ya resueltos a (tamaño, alineación,
+        bytes desperdiciados) y devuelve el mínimo de su fragmento; como los
+        fragmentos siguen el orden de permutaciones_distintas, al quedarse con el
+        primer mínimo el resultado es idéntico al de la búsqueda secuencial.
+        """
+        campos, es_union = self._campos_de(tipo_nombre)
+        elementos = tuple(self._elemento_optimo(campo) for campo in campos)
+        if trabajadores is None:
+            trabajadores = os.cpu_count() or 1
 
-        # Restaurar el tipo original en el diccionario
-        self.tipos[tipo_nombre] = tipo_original
+        # Se fijan tantos campos como hagan falta para tener varios fragmentos por proceso
+        n = len(elementos)
+        largo_prefijo = 0
+        prefijos = [()]
+        while largo_prefijo < n and len(prefijos) < 4 * trabajadores:
+            largo_prefijo += 1
+            prefijos = list(permutaciones_distintas(elementos, largo=largo_prefijo))
 
-        # Seleccionar el mínimo por size_no_empaquetado
-        mejor_size, mejor_alineacion, bits = min(resultados, key=lambda x: x[0])
-        return mejor_size, mejor_alineacion, bits
+        mejor = None
+        with ProcessPoolExecutor(max_workers=trabajadores) as ejecutor:
+            parciales = ejecutor.map(_buscar_en_fragmento, itertools.repeat(elementos),
+                                     itertools.repeat(es_union), prefijos)
+            for resultado in parciales:
+                if mejor is None or resultado[0] < mejor[0]:
+                    mejor = resultado
+        if self.instrumentado:
+            self._estadisticas["permutaciones_evaluadas"] += _contar_permutaciones(elementos)
+        return mejor
 
 
+    def _reordenamiento_acotado(self, tipo_nombre, plazo=None, restantes=None):
+        """Método que devuelve el mejor reordenamiento encontrado dentro del plazo
+
+        Los subtipos se resuelven de las hojas a la raíz con el mismo plazo y
+        presupuesto. En cada struct primero se obtiene un orden bueno con
+        búsqueda local y después, si queda tiempo, se intenta la programación
+        dinámica para demostrar el óptimo. Devuelve (tamaño, alineación, bytes
+        desperdiciados, es_optimo).
+        """
+        resueltos = {}
+        orden = self._compuestos_en_postorden(tipo_nombre, "optimo", resueltos)
+        demostrados = set(resueltos) - self._no_demostrados
+        for actual in orden:
+            campos, es_union = self._campos_de(actual)
+            elementos = []
+            demostrado = True
+            for campo in campos:
+                nombre, clase, representacion, alineacion = self._clasificar(campo)
+                if clase == CLASE_ATOMICO:
+                    elementos.append((representacion, alineacion, 0))
+                else:
+                    elementos.append(resueltos[nombre])
+                    demostrado = demostrado and nombre in demostrados
+
+            if es_union:
+                resultado = _evaluar_elementos(elementos, range(len(elementos)), True)
+            else:
+                resultado, es_optimo = self._struct_acotado(elementos, plazo, restantes)
+                demostrado = demostrado and es_optimo
+                if demostrado:
+                    self._no_demostrados.discard(actual)
+                    self._cache_guardar((actual, "optimo"), resultado)
+            resueltos[actual] = resultado
+            if demostrado:
+                demostrados.add(actual)
+        return resueltos[tipo_nombre] + (tipo_nombre in demostrados,)
 
 
+    def _struct_acotado(self, elementos, plazo, restantes):
+        """Método que devuelve (mejor resultado, es_optimo) de un struct de campos ya resueltos
 
-    def describir_tipo(self, nombre):
+        El relleno de la búsqueda local es la cota de la programación dinámica,
+        así que no se vuelve a calcular sin plazo dentro de _relleno_minimo.
+        """
+        bits_anidados = sum(bits for _, _, bits in elementos)
+        pares = [(size, alineacion) for size, alineacion, _ in elementos]
+        if plazo is None and restantes is None:
+            size, alineacion, relleno, es_optimo = _relleno_minimo(pares)
+            return (size, alineacion, relleno + bits_anidados), es_optimo
+        mejor = _busqueda_local(elementos, plazo, restantes)
+        # Aunque la búsqueda local no deje relleno, la alineación del óptimo es la
+        # de la primera clase que puede empezar un orden mínimo: la confirma la
+        # programación dinámica, que en ese caso solo busca esa clase
+        exacto = _relleno_minimo(pares, plazo, restantes, cota=mejor[0] - sum(size for size, _ in pares))
+        if exacto is None:
+            return mejor, False
+        size, alineacion, relleno, _ = exacto
+        return (size, alineacion, relleno + bits_anidados), True
+
+
+    def _elemento_optimo(self, nombre):
+        """Método que devuelve (tamaño, alineación, bytes desperdiciados) de un campo en su mejor orden"""
+        nombre, clase, representacion, alineacion = self._clasificar(nombre)
+        if clase == CLASE_ATOMICO:
+            return representacion, alineacion, 0
+        return self._reordenamiento_dinamico(nombre)
+
+
+    def _reordenamiento_dinamico(self, tipo_nombre, verificar=False):
+        """Método que calcula el mejor reordenamiento sin recorrer permutaciones
+
+        Con verificar se recalculan siempre el tipo y sus subtipos, de las
+        hojas a la raíz, para que el contraste con la fuerza bruta se ejecute
+        en cada uno.
+        """
+        if not verificar:
+            return self._evaluar_abajo_arriba(tipo_nombre, "optimo")
+        for actual in self._compuestos_en_postorden(tipo_nombre):
+            campos, es_union = self._campos_de(actual)
+            # Los subtipos ya se recalcularon y guardaron en la caché
+            demostrado = [self._no_demostrados.isdisjoint(self._hijos_compuestos(actual))]
+            resultado = _mejor_orden([self._elemento_optimo(campo) for campo in campos], es_union, demostrado)
+
+            # Modo de contraste con la búsqueda exhaustiva
+            if len(campos) <= LIMITE_VERIFICACION:
+                esperado = self.mejor_reordenamiento(actual, metodo="fuerza_bruta")
+                if esperado != resultado:
+                    raise RuntimeError(f"Reordenamiento de '{actual}' inconsistente: "
+                                       f"dinámico {resultado}, fuerza bruta {esperado}")
+            if demostrado[0]:
+                self._no_demostrados.discard(actual)
+            else:
+                self._no_demostrados.add(actual)
+            self._cache_guardar((actual, "optimo"), resultado, persistir=demostrado[0])
+        return resultado
+
+
+
+
+
+    def describir(self, nombre, metricas=None, limite_tiempo=None):
+        """Método que devuelve una Descripcion del tipo sin calcular nada todavía
+
+        metricas limita las métricas disponibles (por defecto, todas las de
+        METRICAS); con limite_tiempo (segundos) el óptimo se busca en modo acotado.
+        """
+        if nombre not in self.tipos:
+            raise KeyError(f"el tipo '{nombre}' no está definido")
+        if metricas is not None:
+            for metrica in metricas:
+                if metrica not in METRICAS:
+                    raise ValueError(f"métrica desconocida: {metrica}")
+        return Descripcion(self, nombre, metricas, limite_tiempo)
+
+
+    def describir_todos(self, nombres=None, metricas=None):
+        """Generador que describe muchos tipos en una sola pasada
+
+        Recorre los tipos dados (por defecto, todos) y sus subtipos en orden de
+        dependencias y produce una Descripcion ya calculada por cada tipo pedido,
+        cada uno después de sus campos. Los resultados de cada subtipo se
+        reutilizan en todos sus contenedores y se descartan en cuanto el último
+        de ellos se procesó; no se guardan en la caché, que solo se consulta.
+        El orden de dependencias y la cuenta de usos sí ocupan memoria lineal en
+        la cantidad de tipos recorridos.
+        """
+        nombres = list(self.tipos) if nombres is None else list(nombres)
+        for nombre in nombres:
+            if nombre not in self.tipos:
+                raise KeyError(f"el tipo '{nombre}' no está definido")
+        metricas = tuple(METRICAS) if metricas is None else tuple(metricas)
+        for metrica in metricas:
+            if metrica not in METRICAS:
+                raise ValueError(f"métrica desconocida: {metrica}")
+        pedir_original = any(metrica not in METRICAS_OPTIMAS for metrica in metricas)
+        pedir_optimo = any(metrica in METRICAS_OPTIMAS for metrica in metricas)
+        seleccion = set(nombres)
+
+        # Orden de dependencias (postorden con pila explícita) y cuántos contenedores usa cada subtipo
+        orden = []
+        visitados = set()
+        usos = Counter()
+        for raiz in nombres:
+            pendientes = [(raiz, False)]
+            while pendientes:
+                actual, expandido = pendientes.pop()
+                if expandido:
+                    orden.append(actual)
+                    continue
+                if actual in visitados:
+                    continue
+                visitados.add(actual)
+                pendientes.append((actual, True))
+                if self._clasificar(actual)[1] != CLASE_ATOMICO:
+                    for hijo in self._hijos_compuestos(actual):
+                        usos[hijo] += 1
+                        pendientes.append((hijo, False))
+
+        originales = {} # Resultados de los subtipos que todavía tienen contenedores por procesar
+        optimos = {}
+        sin_demostrar = set() # De ellos, los de óptimo no demostrado
+        for nombre in orden:
+            descripcion = Descripcion(self, nombre, metricas) if nombre in seleccion else None
+            if self._clasificar(nombre)[1] == CLASE_ATOMICO:
+                if descripcion is not None:
+                    descripcion._calcular(False)
+                    yield descripcion
+                continue
+            campos, es_union = self._campos_de(nombre)
+            if pedir_original:
+                original = self._cache_obtener((nombre, "original"))
+                if original is None:
+                    original = self._evaluar_orden(campos, es_union, False, originales)
+                originales[nombre] = original
+            if pedir_optimo:
+                optimo = self._cache_obtener((nombre, "optimo"))
+                if optimo is None:
+                    elementos = []
+                    demostrado = [True]
+                    for campo in campos:
+                        hijo, clase_hijo, representacion, alineacion = self._clasificar(campo)
+                        if clase_hijo == CLASE_ATOMICO:
+                            elementos.append((representacion, alineacion, 0))
+                        else:
+                            elementos.append(optimos[hijo])
+                            if hijo in sin_demostrar:
+                                demostrado[0] = False
+                    optimo = _mejor_orden(elementos, es_union, demostrado)
+                    if not demostrado[0]:
+                        sin_demostrar.add(nombre)
+                elif nombre in self._no_demostrados:
+                    sin_demostrar.add(nombre)
+                optimos[nombre] = optimo
+            if descripcion is not None:
+                if pedir_original:
+                    (descripcion.tamano_empaquetado, descripcion.tamano_no_empaquetado,
+                     descripcion.alineacion_empaquetado, descripcion.alineacion_no_empaquetado,
+                     descripcion.desperdicio_no_empaquetado) = original
+                    descripcion.desperdicio_empaquetado = 0
+                if pedir_optimo:
+                    descripcion.tamano_optimo, descripcion.alineacion_optimo, descripcion.desperdicio_optimo = optimo
+                    descripcion.optimo_demostrado = nombre not in sin_demostrar
+                yield descripcion
+            for hijo in self._hijos_compuestos(nombre):
+                usos[hijo] -= 1
+                if usos[hijo] == 0:
+                    originales.pop(hijo, None)
+                    optimos.pop(hijo, None)
+                    sin_demostrar.discard(hijo)
+
+
+    def _hijos_compuestos(self, nombre):
+        """Método que devuelve los nombres distintos de los campos compuestos de un tipo, en orden"""
+        hijos = {}
+        for campo in self._campos_de(nombre)[0]:
+            hijo, clase, _, _ = self._clasificar(campo)
+            if clase != CLASE_ATOMICO:
+                hijos[hijo] = None
+        return list(hijos)
+
+
+    def desplazamientos(self, nombre):
+        """Método que devuelve el mapa de desplazamientos de los campos de un compuesto
+
+        Devuelve un diccionario con las disposiciones "empaquetado",
+        "no_empaquetado" y "optimo"; cada una es una lista de (posición original,
+        campo, desplazamiento, relleno previo) en el orden en que quedan los
+        campos. El orden óptimo es uno con el tamaño, la alineación y el
+        relleno de mejor_reordenamiento; en las uniones todos los campos van en 0.
+        """
+        if self._clasificar(nombre)[1] == CLASE_ATOMICO:
+            raise TypeError(f"el tipo '{nombre}' es atómico y no tiene campos")
+        campos, es_union = self._campos_de(nombre)
+        nombres = [self._clasificar(campo)[0] for campo in campos]
+        registro = []
+        self._evaluar_orden(campos, es_union, False, registro=registro)
+        empaquetado = [(i, nombres[i], desplazamiento, 0) for i, (desplazamiento, _, _) in enumerate(registro)]
+        no_empaquetado = [(i, nombres[i], desplazamiento, relleno)
+                          for i, (_, desplazamiento, relleno) in enumerate(registro)]
+
+        elementos = [self._elemento_optimo(campo) for campo in campos]
+        optimo = []
+        if es_union:
+            optimo = [(i, nombres[i], 0, 0) for i in range(len(campos))]
+        else:
+            desplazamiento = 0
+            for i in _orden_relleno_minimo(tuple((size, alineacion) for size, alineacion, _ in elementos)):
+                size, alineacion, _ = elementos[i]
+                hueco = -desplazamiento % alineacion
+                optimo.append((i, nombres[i], desplazamiento + hueco, hueco))
+                desplazamiento += hueco + size
+        return {"empaquetado": empaquetado, "no_empaquetado": no_empaquetado, "optimo": optimo}
+
+
+    def describir_tipo(self, nombre, limite_tiempo=None):
         """Método que proporciona la descripción de un tipo"""
         if nombre not in self.tipos:
-            print(f"Error: el tipo '{nombre}' no está definido.")
+            self.reportar_error(f"Error: el tipo '{nombre}' no está definido.")
             return
         tipo = self.tipos[nombre]
         if isinstance(tipo, TipoAtomico): # Si es atómico
@@ -202,18 +2011,27 @@ class ManejadorTipos:
             es_union = self.es_union(nombre) # Se verifica si el tipo es union
 
             print(f"Tipo {'Union' if es_union else 'Struct'}: {tipo.nombre}")
-            self.describir_registro(nombre, es_union)
+            self.describir_registro(nombre, es_union, limite_tiempo)
         else:
             print(f"Tipo desconocido: {tipo}")
 
     def es_union(self, nombre):
         """Método que verifica si un tipo es union"""
-        return self.tipos[nombre].es_union
+        return self._clasificar(nombre)[1] == CLASE_UNION
+
+    def describir_registro(self, nombre, es_union, limite_tiempo=None):
+        """Método que proporciona la descripción de un registro
 
-    def describir_registro(self, nombre, es_union):
-        """Método que proporciona la descripción de un registro"""
+        Con limite_tiempo (segundos) el orden óptimo se busca en modo acotado.
+        Se indica si el óptimo está demostrado cuando hay límite o cuando no lo está.
+        """
         size_empaquetado, size_no_empaquetado, alineacion_empaquetado, alineacion_no_empaquetado, bit_desperdiciados = self.size_alineacion(nombre, es_union)
-        size_optimo, alineacion_optimo, bits_optimo = self.mejor_reordenamiento(nombre, self.size_alineacion)
+        if limite_tiempo is None:
+            size_optimo, alineacion_optimo, bits_optimo = self.mejor_reordenamiento(nombre)
+            es_optimo = nombre not in self._no_demostrados
+        else:
+            size_optimo, alineacion_optimo, bits_optimo, es_optimo = self.mejor_reordenamiento(
+                nombre, metodo="acotado", limite_tiempo=limite_tiempo)
         print(f"Tamaño empaquetado: {size_empaquetado} bytes")
         print(f"Alineación empaquetado: {alineacion_empaquetado} bytes")
         print(f"Tamaño no empaquetado: {size_no_empaquetado} bytes")
@@ -223,42 +2041,331 @@ class ManejadorTipos:
         print(f"Bytes desperdiciados (empaquetado): {0} bytes")
         print(f"Bytes desperdiciados (no empaquetado): {bit_desperdiciados} bytes")
         print(f"Bytes desperdiciados (óptimo): {bits_optimo} bytes")
+        if limite_tiempo is not None or not es_optimo:
+            print(f"Óptimo demostrado: {'Sí' if es_optimo else 'No'}")
 
-def main():
-    """Método principal"""
-    manejador = ManejadorTipos()
-    while True:
-        accion = input("Ingrese una acción: ")
-        partes = accion.split() # Se separa en partes la acción ingresada 
-        comando = partes[0]
-        match comando:
-            case "ATOMICO":
-                if len(partes) != 4:
-                    print("Error: faltan argumentos o hay argumentos de mas")
-                    continue
-                nombre = partes[1]
+# Bytes de salida acumulados antes de volcarlos en el modo por lotes
+TAMANO_BUFFER_SALIDA = 1 << 16
+
+# Comandos del intérprete; las latencias de cualquier otro se acumulan juntas bajo COMANDO_DESCONOCIDO
+COMANDOS = frozenset({"ATOMICO", "STRUCT", "UNION", "DESCRIBIR", "DESCRIBIR_TODO", "EXPORTAR", "IMPORTAR",
+                      "REDEFINIR", "STATS", "SALIR"})
+COMANDO_DESCONOCIDO = "(desconocido)"
+
+
+def ejecutar_comando(manejador, partes):
+    """Función que ejecuta un comando ya separado en partes; devuelve False con SALIR"""
+    if not manejador.instrumentado:
+        return _despachar_comando(manejador, partes)
+    inicio = time.perf_counter()
+    try:
+        return _despachar_comando(manejador, partes)
+    finally:
+        comando = partes[0] if partes[0] in COMANDOS else COMANDO_DESCONOCIDO
+        manejador.registrar_comando(comando, time.perf_counter() - inicio)
+
+
+def imprimir_metricas(descripcion):
+    """Función que muestra solo las métricas pedidas de una descripción"""
+    for metrica in descripcion.metricas:
+        print(f"{METRICAS[metrica]}: {getattr(descripcion, metrica)} bytes")
+    if any(m in METRICAS_OPTIMAS for m in descripcion.metricas) and \
+            (descripcion._limite_tiempo is not None or not descripcion.optimo_demostrado):
+        print(f"Óptimo demostrado: {'Sí' if descripcion.optimo_demostrado else 'No'}")
+
+
+def argumentos_describir(partes):
+    """Función que separa DESCRIBIR <nombre> [LIMITE <segundos>] [SOLO <métrica>...]
+
+    Devuelve (nombre, límite de tiempo, métricas o None) o un mensaje de error.
+    """
+    if len(partes) < 2:
+        return "Error: faltan argumentos o hay argumentos de mas"
+    nombre = partes[1]
+    resto = partes[2:]
+    limite_tiempo = None
+    metricas = None
+    if resto[:1] == ["LIMITE"]:
+        if len(resto) < 2:
+            return "Error: faltan argumentos o hay argumentos de mas"
+        try:
+            limite_tiempo = float(resto[1])
+        except ValueError:
+            return "Error: el límite de tiempo debe ser un número"
+        resto = resto[2:]
+    if resto[:1] == ["SOLO"]:
+        metricas = resto[1:]
+        if not metricas:
+            return "Error: faltan argumentos o hay argumentos de mas"
+        for metrica in metricas:
+            if metrica not in METRICAS:
+                return f"Error: métrica '{metrica}' desconocida"
+        resto = []
+    if resto:
+        return "Error: faltan argumentos o hay argumentos de mas"
+    return nombre, limite_tiempo, metricas
+
+
+def imprimir_descripciones(manejador, partes):
+    """Función que ejecuta DESCRIBIR_TODO [<nombre>...] [SOLO <métrica>...] mostrando una línea JSON por tipo"""
+    nombres = partes[1:]
+    metricas = None
+    if "SOLO" in nombres:
+        posicion = nombres.index("SOLO")
+        nombres, metricas = nombres[:posicion], nombres[posicion + 1:]
+        if not metricas:
+            manejador.reportar_error("Error: faltan argumentos o hay argumentos de mas")
+            return
+        for metrica in metricas:
+            if metrica not in METRICAS:
+                manejador.reportar_error(f"Error: métrica '{metrica}' desconocida")
+                return
+    for nombre in nombres:
+        if nombre not in manejador.tipos:
+            manejador.reportar_error(f"Error: el tipo '{nombre}' no está definido.")
+            return
+    for descripcion in manejador.describir_todos(nombres or None, metricas):
+        fila = {"nombre": descripcion.nombre, "clase": descripcion.clase}
+        fila.update(descripcion.como_diccionario())
+        if any(metrica in METRICAS_OPTIMAS for metrica in descripcion.metricas) and not descripcion.optimo_demostrado:
+            fila["optimo_demostrado"] = False
+        print(json.dumps(fila, ensure_ascii=False))
+
+
+def imprimir_estadisticas(manejador):
+    """Función que muestra los contadores de instrumentación del manejador"""
+    estadisticas = manejador.estadisticas()
+    print(f"Instrumentación: {'activa' if manejador.instrumentado else 'inactiva'}")
+    print(f"Llamadas a size_alineacion: {estadisticas['llamadas_size_alineacion']}")
+    print(f"Profundidad máxima de recursión: {estadisticas['profundidad_maxima']}")
+    print(f"Llamadas a mejor_reordenamiento: {estadisticas['llamadas_mejor_reordenamiento']}")
+    print(f"Permutaciones evaluadas: {estadisticas['permutaciones_evaluadas']}")
+    print(f"Aciertos de caché: {estadisticas['aciertos_cache']}")
+    print(f"Fallos de caché: {estadisticas['fallos_cache']}")
+    print(f"Aciertos de caché persistente: {estadisticas['aciertos_cache_persistente']}")
+    for comando, datos in estadisticas["comandos"].items():
+        print(f"Comando {comando}: {datos['veces']} veces, total {datos['segundos']:.6f} s, "
+              f"máximo {datos['maximo']:.6f} s")
+
+
+def _despachar_comando(manejador, partes):
+    """Función que ejecuta el comando según su nombre"""
+    comando = partes[0]
+    match comando:
+        case "ATOMICO":
+            if len(partes) != 4:
+                manejador.reportar_error("Error: faltan argumentos o hay argumentos de mas")
+                return True
+            nombre = partes[1]
+            try:
                 representacion = int(partes[2])
                 alineacion = int(partes[3])
-                manejador.agregar_tipo_atomico(nombre, representacion, alineacion) 
-            case "STRUCT":
-                nombre = partes[1]
-                tipos_campos = partes[2:]
-                manejador.agregar_tipo_compuesto(nombre, tipos_campos)  
-            case "UNION":
-                nombre = partes[1]
-                tipos_campos = partes[2:]
-                manejador.agregar_tipo_compuesto(nombre, tipos_campos, es_union=True)
-            case "DESCRIBIR":
-                if len(partes) != 2:
-                    print("Error: faltan argumentos o hay argumentos de mas")
-                    continue
-                nombre = partes[1]
-                manejador.describir_tipo(nombre)
-            case "SALIR":
-                print("Saliendo")
+            except ValueError:
+                manejador.reportar_error("Error: la representación y la alineación deben ser enteros")
+                return True
+            manejador.agregar_tipo_atomico(nombre, representacion, alineacion)
+        case "STRUCT" | "UNION":
+            if len(partes) < 2:
+                manejador.reportar_error("Error: faltan argumentos o hay argumentos de mas")
+                return True
+            nombre = partes[1]
+            tipos_campos = partes[2:]
+            manejador.agregar_tipo_compuesto(nombre, tipos_campos, es_union=comando == "UNION")
+        case "DESCRIBIR":
+            # DESCRIBIR <nombre> [LIMITE <segundos>] [SOLO <métrica>...]
+            argumentos = argumentos_describir(partes)
+            if isinstance(argumentos, str):
+                manejador.reportar_error(argumentos)
+                return True
+            nombre, limite_tiempo, metricas = argumentos
+            if metricas is None:
+                manejador.describir_tipo(nombre, limite_tiempo)
+            elif nombre not in manejador.tipos:
+                manejador.reportar_error(f"Error: el tipo '{nombre}' no está definido.")
+            else:
+                imprimir_metricas(manejador.describir(nombre, metricas, limite_tiempo))
+        case "DESCRIBIR_TODO":
+            # DESCRIBIR_TODO [<nombre>...] [SOLO <métrica>...]
+            imprimir_descripciones(manejador, partes)
+        case "EXPORTAR":
+            # EXPORTAR <ruta> [<nombre>...]
+            if len(partes) < 2:
+                manejador.reportar_error("Error: faltan argumentos o hay argumentos de mas")
+                return True
+            for nombre in partes[2:]:
+                if nombre not in manejador.tipos or manejador._clasificar(nombre)[1] == CLASE_ATOMICO:
+                    manejador.reportar_error(f"Error: el tipo '{nombre}' no es un compuesto definido.")
+                    return True
+            try:
+                manejador.exportar_desplazamientos(partes[1], partes[2:] or None)
+            except OSError as error:
+                manejador.reportar_error(f"Error: no se pudo escribir '{partes[1]}': {error}")
+        case "IMPORTAR":
+            if len(partes) != 2:
+                manejador.reportar_error("Error: faltan argumentos o hay argumentos de mas")
+                return True
+            for error in manejador.cargar_esquema(partes[1]):
+                manejador.reportar_error(error)
+        case "REDEFINIR":
+            # REDEFINIR ATOMICO <nombre> <representación> <alineación> | REDEFINIR STRUCT|UNION <nombre> <campos>
+            if len(partes) < 3 or partes[1] not in ("ATOMICO", "STRUCT", "UNION") or \
+                    (partes[1] == "ATOMICO" and len(partes) != 5):
+                manejador.reportar_error("Error: faltan argumentos o hay argumentos de mas")
+                return True
+            nombre = partes[2]
+            if partes[1] == "ATOMICO":
+                try:
+                    representacion = int(partes[3])
+                    alineacion = int(partes[4])
+                except ValueError:
+                    manejador.reportar_error("Error: la representación y la alineación deben ser enteros")
+                    return True
+                manejador.redefinir_tipo_atomico(nombre, representacion, alineacion)
+            else:
+                manejador.redefinir_tipo_compuesto(nombre, partes[3:], es_union=partes[1] == "UNION")
+        case "STATS":
+            # STATS [REINICIAR | ACTIVAR | DESACTIVAR]
+            if len(partes) == 1:
+                imprimir_estadisticas(manejador)
+            elif len(partes) == 2 and partes[1] == "REINICIAR":
+                manejador.reiniciar_estadisticas()
+            elif len(partes) == 2 and partes[1] in ("ACTIVAR", "DESACTIVAR"):
+                manejador.instrumentado = partes[1] == "ACTIVAR"
+            else:
+                manejador.reportar_error("Error: faltan argumentos o hay argumentos de mas")
+        case "SALIR":
+            print("Saliendo")
+            return False
+        case _:
+            manejador.reportar_error(f"Error: acción '{comando}' desconocida")
+    return True
+
+
+def leer_desplazamientos(ruta):
+    """Función que lee un archivo binario de exportar_desplazamientos
+
+    Devuelve un diccionario columna -> lista de valores; las columnas tipo y
+    campo se devuelven ya convertidas a nombres y disposicion a su texto.
+    """
+    with open(ruta, "rb") as archivo:
+        datos = archivo.read()
+    marca, version, cantidad_nombres, filas = ENCABEZADO_DESPLAZAMIENTOS.unpack_from(datos)
+    if marca != MARCA_DESPLAZAMIENTOS or version != 1:
+        raise ValueError(f"'{ruta}' no es una exportación de desplazamientos")
+    posicion = ENCABEZADO_DESPLAZAMIENTOS.size
+    nombres = []
+    for _ in range(cantidad_nombres):
+        (largo,) = struct.unpack_from("<H", datos, posicion)
+        nombres.append(datos[posicion + 2:posicion + 2 + largo].decode("utf-8"))
+        posicion += 2 + largo
+    columnas = {}
+    for columna, formato in COLUMNAS_DESPLAZAMIENTOS:
+        columnas[columna] = list(struct.unpack_from(f"<{filas}{formato}", datos, posicion))
+        posicion += struct.calcsize(f"<{filas}{formato}")
+    columnas["tipo"] = [nombres[i] for i in columnas["tipo"]]
+    columnas["campo"] = [nombres[i] for i in columnas["campo"]]
+    columnas["disposicion"] = [DISPOSICIONES[i] for i in columnas["disposicion"]]
+    return columnas
+
+
+def leer_comandos(lineas):
+    """Generador que produce (número de línea, partes) de cada línea no vacía"""
+    for numero, linea in enumerate(lineas, start=1):
+        partes = linea.split()
+        if partes:
+            yield numero, partes
+
+
+def _definicion_desde_json(objeto):
+    """Función que convierte un objeto JSON de esquema en una definición para importar_esquema
+
+    Formato: {"tipo": "ATOMICO", "nombre": ..., "representacion": ..., "alineacion": ...}
+    o {"tipo": "STRUCT"|"UNION", "nombre": ..., "campos": [...]}.
+    """
+    if objeto["tipo"] == "ATOMICO":
+        return "ATOMICO", objeto["nombre"], int(objeto["representacion"]), int(objeto["alineacion"])
+    if objeto["tipo"] in ("STRUCT", "UNION"):
+        return objeto["tipo"], objeto["nombre"], list(objeto["campos"])
+    raise ValueError(f"tipo de definición desconocido: {objeto['tipo']}")
+
+
+def leer_esquema_comandos(lineas):
+    """Generador que convierte líneas ATOMICO/STRUCT/UNION en definiciones para importar_esquema"""
+    for numero, partes in leer_comandos(lineas):
+        comando = partes[0]
+        if comando == "ATOMICO" and len(partes) == 4:
+            yield comando, partes[1], int(partes[2]), int(partes[3])
+        elif comando in ("STRUCT", "UNION") and len(partes) >= 2:
+            yield comando, partes[1], partes[2:]
+        else:
+            raise ValueError(f"línea {numero}: definición inválida '{' '.join(partes)}'")
+
+
+def ejecutar_script(manejador, lineas, salida=None, numerar_errores=False):
+    """Función que ejecuta un flujo de comandos sin interacción
+
+    La salida se acumula en memoria y se escribe en bloques de
+    TAMANO_BUFFER_SALIDA bytes. Con numerar_errores los errores no se imprimen
+    en línea: se devuelven como una lista de mensajes con su número de línea.
+    """
+    if salida is None:
+        salida = sys.stdout
+    errores = []
+    linea_actual = 0
+    if numerar_errores:
+        manejador.reportar_error = lambda mensaje: errores.append(f"Línea {linea_actual}: {mensaje}")
+    buffer = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buffer):
+            for linea_actual, partes in leer_comandos(lineas):
+                seguir = ejecutar_comando(manejador, partes)
+                if buffer.tell() >= TAMANO_BUFFER_SALIDA:
+                    salida.write(buffer.getvalue())
+                    buffer.seek(0)
+                    buffer.truncate()
+                if not seguir:
+                    break
+    finally:
+        salida.write(buffer.getvalue())
+        if numerar_errores:
+            del manejador.reportar_error
+    return errores
+
+
+def main(argv=None):
+    """Método principal"""
+    parser = argparse.ArgumentParser(description="Manejador de tipos de datos")
+    parser.add_argument("--script", help="archivo de comandos a ejecutar ('-' para la entrada estándar)")
+    parser.add_argument("--errores-numerados", action="store_true",
+                        help="informar los errores al final con su número de línea")
+    parser.add_argument("--cache-persistente", help="archivo SQLite donde reutilizar resultados entre ejecuciones")
+    parser.add_argument("--estadisticas", action="store_true",
+                        help="activar la instrumentación desde el inicio (también con STATS ACTIVAR)")
+    argumentos = parser.parse_args(argv or [])
+    manejador = ManejadorTipos(instrumentado=argumentos.estadisticas, cache_persistente=argumentos.cache_persistente)
+    try:
+        if argumentos.script is not None:
+            if argumentos.script == "-":
+                errores = ejecutar_script(manejador, sys.stdin, numerar_errores=argumentos.errores_numerados)
+            else:
+                with open(argumentos.script, encoding="utf-8") as archivo:
+                    errores = ejecutar_script(manejador, archivo, numerar_errores=argumentos.errores_numerados)
+            for error in errores:
+                print(error, file=sys.stderr)
+            return
+
+        while True:
+            try:
+                accion = input("Ingrese una acción: ")
+            except EOFError:
+                break
+            partes = accion.split() # Se separa en partes la acción ingresada 
+            if not partes:
+                continue
+            if not ejecutar_comando(manejador, partes):
                 break
-            case _:
-                print(f"Accion {comando} desconocida")
+    finally:
+        manejador.cerrar()
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])